@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import MedicalCenter, Medicine, Stock, MedicineReceipt, WeeklyConsumptionReport, MedicineBatch
+from .models import MedicalCenter, Medicine, Stock, MedicineReceipt, WeeklyConsumptionReport, MedicineBatch, ImportJob, IdempotencyKey
 
 
 @admin.register(MedicalCenter)
@@ -74,3 +74,21 @@ class WeeklyConsumptionReportAdmin(admin.ModelAdmin):
             "classes": ("collapse",)
         }),
     )
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['file_name', 'kind', 'status', 'rows_processed', 'rows_total', 'success_count', 'created_by', 'created_at']
+    list_filter = ['kind', 'status']
+    search_fields = ['file_name']
+    exclude = ['file_content']
+    readonly_fields = [
+        'kind', 'status', 'created_by', 'file_name',
+        'rows_total', 'rows_processed', 'success_count', 'errors', 'message',
+        'created_at', 'started_at', 'finished_at',
+    ]
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'user', 'response_status', 'created_at']
+    search_fields = ['key']
+    readonly_fields = ['user', 'key', 'request_hash', 'response_status', 'response_body', 'created_at']
@@ -1,51 +1,359 @@
-from django.db import models
-from django.db.models import Sum
-from .models import WeeklyConsumptionReport, Stock, MedicineReceipt, MedicineBatch
-from datetime import timedelta
-from django.utils import timezone
-
-def get_total_consumed_per_center():
-    return WeeklyConsumptionReport.objects.values(
-        'center__id', 'center__name'
-    ).annotate(
-        total_consumed=Sum('quantity')
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+
+from ..cache import CENTERS, MEDICINES, REPORTS, STOCK, versioned_key
+from ..models import (
+    ConsumptionRollup, MedicalCenter, Medicine, MedicineBatch, MedicineReceipt, Stock,
+    WeeklyConsumptionReport,
+)
+
+
+def week_monday(day):
+    return day - timedelta(days=day.weekday())
+
+
+def get_total_consumed_per_center(start=None, end=None):
+    """Units consumed per center over the reports overlapping [start, end], largest first."""
+    reports = WeeklyConsumptionReport.objects.all()
+    if start:
+        reports = reports.filter(week_end__gte=start)
+    if end:
+        reports = reports.filter(week_start__lte=end)
+    return list(
+        reports
+        .values('center_id', center_name=F('center__name'))
+        .annotate(total_consumed=Sum('quantity_used'))
+        .order_by('-total_consumed')
     )
 
-def get_total_stock_per_center():
-    return Stock.objects.values(
-        'center__id', 'center__name'
-    ).annotate(
-        total_stock=Sum('quantity')
+
+def get_total_stock_per_center(low_stock_threshold=10):
+    """Stock held per center with the number of medicines in stock and running low."""
+    return list(
+        Stock.objects
+        .values('center_id', center_name=F('center__name'))
+        .annotate(
+            total_stock=Sum('total_quantity'),
+            medicines_in_stock=Count('id', filter=Q(total_quantity__gt=0)),
+            low_stock=Count('id', filter=Q(total_quantity__lte=low_stock_threshold)),
+        )
+        .order_by('center_name')
     )
 
+
 def get_low_stock_alerts(threshold=10):
-    return Stock.objects.filter(quantity__lt=threshold)
+    return list(
+        Stock.objects
+        .filter(total_quantity__lte=threshold)
+        .values(
+            center_name=F('center__name'),
+            medicine_name=F('medicine__name'),
+            unit=F('medicine__unit'),
+            stock_quantity=F('total_quantity'),
+        )
+        .order_by('total_quantity')
+    )
+
+
+def get_top_medicines(limit=5, since=None):
+    """Most consumed medicines, read from the weekly rollups (ISO weeks starting on or after `since`)."""
+    rollups = ConsumptionRollup.objects.filter(period=ConsumptionRollup.WEEK)
+    if since:
+        rollups = rollups.filter(period_start__gte=week_monday(since))
+    return list(
+        rollups
+        .values('medicine_id', name=F('medicine__name'), unit=F('medicine__unit'))
+        .annotate(total_consumed=Sum('quantity_used'))
+        .filter(total_consumed__gt=0)
+        .order_by('-total_consumed')[:limit]
+    )
 
-def get_top_medicines(limit=5):
-    return WeeklyConsumptionReport.objects.values(
-        'medicine__id', 'medicine__name'
-    ).annotate(
-        total_consumed=Sum('quantity')
-    ).order_by('-total_consumed')[:limit]
 
 def get_recent_receipts(limit=5):
-    return MedicineReceipt.objects.select_related('center', 'medicine').order_by('-date_received')[:limit]
-
-def consume_medicine(center, medicine, quantity):
-    total_available = MedicineBatch.objects.filter(
-        center=center, medicine=medicine
-    ).aggregate(total=models.Sum("quantity"))["total"] or 0
-
-    if quantity > total_available:
-        raise ValueError(f"Not enough stock to consume {quantity} units of {medicine}")
-    batches = MedicineBatch.objects.filter(center=center, medicine=medicine).order_by("exp_date")
-    remaining = quantity
-    for batch in batches:
-        if batch.quantity >= remaining:
-            batch.quantity -= remaining
-            batch.save()
-            break
-        else:
-            remaining -= batch.quantity
-            batch.quantity = 0
-            batch.save()
\ No newline at end of file
+    return list(
+        MedicineReceipt.objects
+        .order_by('-received_date', '-id')
+        .values(
+            'id', 'quantity_received', 'received_date', 'exp_date',
+            center_name=F('center__name'),
+            medicine_name=F('medicine__name'),
+            unit=F('medicine__unit'),
+        )[:limit]
+    )
+
+
+def weekly_consumption_matrix(weeks, today=None):
+    """
+    Weekly consumption over the last `weeks` complete-or-current ISO weeks as a dense matrix.
+
+    Returns (pairs, week_starts, matrix) where `pairs` is an (n, 2) array of
+    (center_id, medicine_id), `week_starts` the Monday of each column and `matrix[i, j]`
+    the units pair i used in week j. Built from one values_list fetch of the rollups.
+    """
+    today = today or date.today()
+    first_week = week_monday(today) - timedelta(weeks=weeks - 1)
+    rows = np.array(
+        list(
+            ConsumptionRollup.objects
+            .filter(
+                period=ConsumptionRollup.WEEK,
+                period_start__gte=first_week,
+                period_start__lte=week_monday(today),  # reports dated in a future week have no column
+            )
+            .values_list('center_id', 'medicine_id', 'period_start', 'quantity_used')
+        ),
+        dtype=object,
+    ).reshape(-1, 4)
+    week_starts = [first_week + timedelta(weeks=i) for i in range(weeks)]
+    if not len(rows):
+        return np.empty((0, 2), dtype=np.int64), week_starts, np.zeros((0, weeks))
+
+    ids = rows[:, :2].astype(np.int64)
+    pairs, pair_index = np.unique(ids, axis=0, return_inverse=True)
+    column = {week_start: i for i, week_start in enumerate(week_starts)}
+    offsets = np.fromiter((column[start] for start in rows[:, 2]), dtype=np.int64, count=len(rows))
+    matrix = np.zeros((len(pairs), weeks))
+    np.add.at(matrix, (pair_index.ravel(), offsets), rows[:, 3].astype(np.float64))
+    return pairs, week_starts, matrix
+
+
+def get_consumption_velocity(weeks=8, today=None):
+    """
+    Average weekly consumption and its trend (units/week change, least-squares slope)
+    per center and medicine over the last `weeks` ISO weeks, computed for every pair at once.
+    """
+    pairs, _, matrix = weekly_consumption_matrix(weeks, today)
+    if not len(pairs):
+        return []
+
+    average = matrix.mean(axis=1)
+    x = np.arange(weeks) - (weeks - 1) / 2
+    trend = (matrix - average[:, None]) @ x / (x @ x) if weeks > 1 else np.zeros(len(pairs))
+
+    names = _pair_names(pairs)
+    return [
+        {
+            "center_id": int(center_id),
+            "medicine_id": int(medicine_id),
+            **names[(center_id, medicine_id)],
+            "average_weekly": round(float(avg), 2),
+            "trend": round(float(slope), 2),
+            "last_week": int(matrix[i, -1]),
+        }
+        for i, ((center_id, medicine_id), avg, slope) in enumerate(zip(pairs.tolist(), average, trend))
+    ]
+
+
+def average_weekly_consumption(weeks, today=None):
+    """
+    (pairs, averages) over the last `weeks` ISO weeks. Only depends on the reports, so it is
+    cached against their version: stock movements alone reuse it, and a new weekly report
+    recomputes it from the incrementally maintained rollups rather than from the reports.
+    """
+    today = today or date.today()
+    key = versioned_key('consumption-average', [REPORTS], weeks, week_monday(today))
+    result = cache.get(key)
+    if result is None:
+        pairs, _, matrix = weekly_consumption_matrix(weeks, today)
+        result = (pairs, matrix.mean(axis=1))
+        cache.set(key, result, settings.ANALYTICS_CACHE_TIMEOUT)
+    return result
+
+
+def _pair_codes(pairs, base):
+    return pairs[:, 0] * base + pairs[:, 1]
+
+
+def forecast_stock_out(weeks=8, within=None, today=None):
+    """
+    Days of cover and expected stock-out date for every (center, medicine) that holds stock
+    or consumed some over the window: current stock divided by the average daily consumption,
+    for all pairs at once. Pairs without consumption have no stock-out date. Sorted by the
+    soonest stock-out; `within` keeps only pairs running out within that many days.
+    """
+    today = today or date.today()
+    key = versioned_key('forecast', [CENTERS, MEDICINES, REPORTS, STOCK], weeks, within, today)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    consumed_pairs, averages = average_weekly_consumption(weeks, today)
+    stock = np.array(
+        list(Stock.objects.values_list('center_id', 'medicine_id', 'total_quantity')), dtype=np.int64
+    ).reshape(-1, 3)
+
+    # Align both sides on one (center, medicine) code per pair with sorted lookups.
+    base = int(max(stock[:, 1].max(initial=0), consumed_pairs[:, 1].max(initial=0))) + 1
+    pairs = np.unique(np.concatenate([stock[:, :2], consumed_pairs]), axis=0)
+    codes = _pair_codes(pairs, base)
+    quantities = np.zeros(len(pairs), dtype=np.int64)
+    quantities[np.searchsorted(codes, _pair_codes(stock[:, :2], base))] = stock[:, 2]
+    weekly = np.zeros(len(pairs))
+    weekly[np.searchsorted(codes, _pair_codes(consumed_pairs, base))] = averages
+
+    daily = weekly / 7
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(daily > 0, quantities / daily, np.inf)
+    keep = cover <= within if within is not None else np.ones(len(pairs), dtype=bool)
+    order = np.argsort(cover[keep], kind='stable')
+    pairs, quantities, weekly, cover = pairs[keep][order], quantities[keep][order], weekly[keep][order], cover[keep][order]
+
+    # Covers too long to land on a calendar date are reported without one.
+    dated = cover < (date.max - today).days
+    names = _pair_names(pairs) if len(pairs) else {}
+    result = [
+        {
+            "center_id": center_id,
+            "medicine_id": medicine_id,
+            **names[(center_id, medicine_id)],
+            "stock_quantity": int(quantity),
+            "average_weekly": round(float(rate), 2),
+            "days_of_cover": None if np.isinf(days) else round(float(days), 1),
+            "stock_out_date": today + timedelta(days=int(days)) if has_date else None,
+        }
+        for (center_id, medicine_id), quantity, rate, days, has_date
+        in zip(pairs.tolist(), quantities, weekly, cover, dated)
+    ]
+    cache.set(key, result, settings.ANALYTICS_CACHE_TIMEOUT)
+    return result
+
+
+def expiry_risk_frame(days=30, weeks=8, today=None):
+    """
+    Non-empty batches that expired or expire within `days` as a DataFrame, with the units
+    projected to expire unused at the average consumption of the last `weeks`.
+
+    Batches are drawn first-expiry-first-out, so by the time batch i of a (center, medicine)
+    expires at most rate * days_left units of it and the earlier batches have been used:
+    the units wasted up to batch i are the running maximum of (cumulative quantity -
+    rate * days_left), and each batch's own share is the step in that maximum. Expired
+    batches are wasted in full. One range query on batch_expiry_idx, one pandas pass;
+    the frame is cached against the table versions it reads.
+    """
+    today = today or date.today()
+    key = versioned_key('expiry-risk', [CENTERS, MEDICINES, REPORTS, STOCK], days, weeks, today)
+    batches = cache.get(key)
+    if batches is not None:
+        return batches
+
+    columns = ['id', 'batch_code', 'center_id', 'medicine_id', 'exp_date', 'quantity']
+    batches = pd.DataFrame.from_records(
+        list(
+            MedicineBatch.objects
+            .filter(quantity__gt=0, exp_date__lte=today + timedelta(days=days))
+            .order_by('center_id', 'medicine_id', 'exp_date', 'id')
+            .values_list(*columns)
+        ),
+        columns=columns,
+    ).astype({'id': np.int64, 'center_id': np.int64, 'medicine_id': np.int64, 'quantity': np.int64})
+    pairs, averages = average_weekly_consumption(weeks, today)
+    rates = pd.DataFrame({
+        'center_id': pairs[:, 0], 'medicine_id': pairs[:, 1], 'daily_rate': averages / 7,
+    })
+    batches = batches.merge(rates, on=['center_id', 'medicine_id'], how='left')
+    batches['daily_rate'] = batches['daily_rate'].fillna(0.0)
+    batches['days_left'] = (pd.to_datetime(batches['exp_date']) - pd.Timestamp(today)).dt.days
+
+    expired = batches['days_left'] < 0
+    usable = batches[~expired].copy()
+    pair = [usable['center_id'], usable['medicine_id']]
+    usable['excess'] = (
+        usable.groupby(pair)['quantity'].cumsum() - usable['daily_rate'] * usable['days_left']
+    ).clip(lower=0)
+    wasted = usable.groupby(pair)['excess'].cummax()
+    usable['projected_unused'] = wasted - wasted.groupby(pair).shift(fill_value=0)
+    batches['projected_unused'] = batches['quantity'].astype(np.float64)
+    batches.loc[usable.index, 'projected_unused'] = usable['projected_unused']
+    batches['projected_unused'] = batches['projected_unused'].round().astype(np.int64)
+
+    batches = batches.drop(columns='daily_rate').sort_values(['exp_date', 'id'], ignore_index=True)
+    cache.set(key, batches, settings.ANALYTICS_CACHE_TIMEOUT)
+    return batches
+
+
+def get_expiry_risk_summary(days=30, weeks=8, today=None):
+    """Per-center totals of expiry_risk_frame(), most units projected unused first."""
+    batches = expiry_risk_frame(days, weeks, today)
+    if batches.empty:
+        return []
+    totals = (
+        batches.groupby('center_id')
+        .agg(batches_at_risk=('id', 'size'), quantity_at_risk=('quantity', 'sum'),
+             projected_unused=('projected_unused', 'sum'))
+        .sort_values('projected_unused', ascending=False)
+    )
+    centers = dict(MedicalCenter.objects.filter(id__in=totals.index.tolist()).values_list('id', 'name'))
+    return [
+        {
+            "center_id": center_id,
+            "center_name": centers.get(center_id),
+            "batches_at_risk": batches_at_risk,
+            "quantity_at_risk": quantity_at_risk,
+            "projected_unused": projected_unused,
+        }
+        for center_id, batches_at_risk, quantity_at_risk, projected_unused
+        in totals.reset_index().itertuples(index=False)
+    ]
+
+
+def get_expiry_risk(days=30, weeks=8, center=None, today=None):
+    """expiry_risk_frame() grouped by center with the batch details, optionally for one center."""
+    batches = expiry_risk_frame(days, weeks, today)
+    if center is not None:
+        batches = batches[batches['center_id'] == center]
+    if batches.empty:
+        return []
+    medicines = {
+        medicine_id: (name, unit)
+        for medicine_id, name, unit in Medicine.objects
+        .filter(id__in=batches['medicine_id'].unique().tolist())
+        .values_list('id', 'name', 'unit')
+    }
+    details = batches.groupby('center_id')[
+        ['id', 'batch_code', 'medicine_id', 'exp_date', 'days_left', 'quantity', 'projected_unused']
+    ]
+    result = []
+    for summary in get_expiry_risk_summary(days, weeks, today):
+        if center is not None and summary["center_id"] != center:
+            continue
+        summary["batches"] = [
+            {
+                "batch_id": batch_id,
+                "batch_code": batch_code,
+                "medicine_id": medicine_id,
+                "medicine_name": medicines.get(medicine_id, (None, None))[0],
+                "unit": medicines.get(medicine_id, (None, None))[1],
+                "exp_date": exp_date,
+                "days_left": days_left,
+                "quantity": quantity,
+                "projected_unused": projected_unused,
+            }
+            for batch_id, batch_code, medicine_id, exp_date, days_left, quantity, projected_unused
+            in details.get_group(summary["center_id"]).itertuples(index=False)
+        ]
+        result.append(summary)
+    return result
+
+
+def _pair_names(pairs):
+    """Center and medicine names for (center_id, medicine_id) pairs, one query per table."""
+    centers = dict(MedicalCenter.objects.filter(id__in=set(pairs[:, 0].tolist())).values_list('id', 'name'))
+    medicines = {
+        medicine_id: (name, unit)
+        for medicine_id, name, unit in Medicine.objects
+        .filter(id__in=set(pairs[:, 1].tolist()))
+        .values_list('id', 'name', 'unit')
+    }
+    return {
+        (center_id, medicine_id): {
+            "center_name": centers.get(center_id),
+            "medicine_name": medicines.get(medicine_id, (None, None))[0],
+            "unit": medicines.get(medicine_id, (None, None))[1],
+        }
+        for center_id, medicine_id in pairs.tolist()
+    }
@@ -0,0 +1,52 @@
+import hashlib
+import time
+
+from django.db import transaction
+from django.db.models import F
+
+# Tables whose writes invalidate cached inventory reads. Each has a version counter (a
+# TableVersion row, shared by every process); readers build their cache keys and ETags from
+# the versions they depend on, so a bump makes the old entries unreachable instead of having
+# to find and delete them.
+CENTERS = 'centers'
+MEDICINES = 'medicines'
+STOCK = 'stock'
+RECEIPTS = 'receipts'
+REPORTS = 'reports'
+
+DASHBOARD_TABLES = [CENTERS, MEDICINES, STOCK, RECEIPTS, REPORTS]
+
+
+def get_versions(tables):
+    """Current version of each table, in one query. Missing counters start from the clock so they never repeat."""
+    from .models import TableVersion
+
+    versions = dict(TableVersion.objects.filter(table__in=tables).values_list('table', 'version'))
+    missing = [table for table in tables if table not in versions]
+    if missing:
+        TableVersion.objects.bulk_create(
+            [TableVersion(table=table, version=time.time_ns()) for table in missing], ignore_conflicts=True,
+        )
+        versions.update(TableVersion.objects.filter(table__in=missing).values_list('table', 'version'))
+    return [versions[table] for table in tables]
+
+
+def _bump(tables):
+    from .models import TableVersion
+
+    TableVersion.objects.filter(table__in=tables).update(version=F('version') + 1)
+
+
+def bump_versions(*tables):
+    """Invalidate cached reads of `tables` once the current transaction commits."""
+    transaction.on_commit(lambda: _bump(tables))
+
+
+def versioned_digest(tables, *parts):
+    return hashlib.md5(
+        ":".join(str(value) for value in [*get_versions(tables), *parts]).encode()
+    ).hexdigest()
+
+
+def versioned_key(prefix, tables, *parts):
+    return f"inventory:{prefix}:{versioned_digest(tables, *parts)}"
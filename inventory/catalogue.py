@@ -0,0 +1,94 @@
+import unicodedata
+
+from django.db import connection
+
+from .cache import CENTERS, MEDICINES, get_versions
+from .models import MedicalCenter, Medicine
+
+# Name lookups for the small, rarely written tables. Each process keeps structures built
+# from every (id, name) of a model (the {name key: id} map here, the search index in
+# search.py), stamped with the table version from cache.py: a write anywhere bumps the
+# version (signals, or bump_versions after bulk writes) and the next lookup rebuilds, while
+# this process's own saves and deletes drop its copies at once (see signals.py).
+CATALOGUE_TABLES = {
+    MedicalCenter: CENTERS,
+    Medicine: MEDICINES,
+}
+
+_catalogues = {}
+
+
+def normalize_name(name):
+    """The views' clean-up of a name typed in a sheet or form."""
+    return str(name).strip().replace('\u00a0', ' ')
+
+
+def fold(text):
+    """`text` without accents and case: 'Paracétamol' and 'PARACETAMOL' fold the same."""
+    if text.isascii():
+        return text.casefold()
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def name_key(name):
+    """Accent- and case-insensitive key of a name."""
+    return fold(normalize_name(name))
+
+
+def invalidate(model):
+    for key in [key for key in _catalogues if key[0] is model]:
+        _catalogues.pop(key, None)
+
+
+def cached_catalogue(model, build):
+    """
+    `build(rows)` over the (id, name) rows of `model`, newest first, kept until the table
+    version changes.
+
+    While the current transaction has version bumps pending it may have written rows the
+    cached copy lacks (bulk creates send no signals), and what it reads may never be
+    committed: the table is read directly and nothing is kept.
+    """
+    pending_writes = connection.in_atomic_block and connection.run_on_commit
+    version = get_versions([CATALOGUE_TABLES[model]])[0]
+    cached = _catalogues.get((model, build))
+    if cached is not None and cached[0] == version and not pending_writes:
+        return cached[1]
+
+    value = build(model.objects.order_by('-id').values_list('id', 'name').iterator())
+    if not pending_writes:
+        _catalogues[(model, build)] = (version, value)
+    return value
+
+
+def _keys(rows):
+    return [(name_key(name), pk) for pk, name in rows]
+
+
+def get_keys(model):
+    """[(name key, id)] of every row of `model`; names are not unique, so keys may repeat."""
+    return cached_catalogue(model, _keys)
+
+
+def _ids_by_key(rows):
+    # Newest first, so when two names share a key the oldest row wins.
+    return {name_key(name): pk for pk, name in rows}
+
+
+def get_catalogue(model):
+    """{name key: id} for resolving names: one id per key, the oldest row's."""
+    return cached_catalogue(model, _ids_by_key)
+
+
+def resolve_names(model, names):
+    """{name key: id} for the given names (already normalised or not) that exist."""
+    ids = get_catalogue(model)
+    keys = {name_key(name) for name in names}
+    return {key: ids[key] for key in keys if key in ids}
+
+
+def search(model, terms):
+    """Ids of all the rows whose name contains every term, ignoring case and accents."""
+    terms = [name_key(term) for term in terms]
+    return [pk for key, pk in get_keys(model) if all(term in key for term in terms)]
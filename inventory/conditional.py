@@ -0,0 +1,51 @@
+from functools import wraps
+
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import versioned_digest
+
+
+def etag_matches(request, etag):
+    """True when the request's If-None-Match names `etag` (weak comparison, as for GET)."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag.removeprefix('W/') in (tag.removeprefix('W/') for tag in etags)
+
+
+def with_etag(response, etag):
+    response['ETag'] = etag
+    # Let clients keep the body but revalidate it on every use.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified(etag):
+    return with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+
+def conditional(*tables):
+    """
+    ETag support for a GET view method whose response depends only on `tables` and the URL.
+
+    The ETag is a digest of the tables' version counters (see cache.py), the full path and
+    the negotiated media type. Reading the versions is one primary-key query, and a request
+    whose If-None-Match still matches gets its 304 right after it, before the data is read
+    or serialized. Versions are read before the data, so a write landing in between only
+    makes the next request miss.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            etag = quote_etag(versioned_digest(tables, request.get_full_path(), request.accepted_media_type))
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            response = view_method(self, request, *args, **kwargs)
+            if status.is_success(response.status_code):
+                with_etag(response, etag)
+            return response
+        return wrapper
+    return decorator
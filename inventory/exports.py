@@ -0,0 +1,187 @@
+import csv
+import importlib.util
+import tempfile
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db.models import Max, Sum
+from django.db.models.functions import Length
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+
+WEEKLY_REPORT_HEADERS = [
+    "Semaine du", "Semaine au", "Centre médical", "Nom du Médicament",
+    "Unité", "Quantité Consommée", "Observation"
+]
+
+WEEKLY_REPORT_FIELDS = [
+    'week_start', 'week_end', 'center__name', 'medicine__name',
+    'medicine__unit', 'quantity_used', 'observation'
+]
+
+# group_by dimensions, in the column order they appear in a grouped export
+GROUP_BY_DIMENSIONS = {
+    'week': [("Semaine du", 'week_start'), ("Semaine au", 'week_end')],
+    'center': [("Centre médical", 'center__name')],
+    'medicine': [("Nom du Médicament", 'medicine__name'), ("Unité", 'medicine__unit')],
+}
+
+EXPORT_FORMATS = ['xlsx', 'csv', 'parquet']
+
+EXPORT_DATE_FORMAT = '%d-%m-%Y'
+DATE_FIELDS = {'week_start', 'week_end'}
+
+
+def parse_group_by(value):
+    """Turn `?group_by=center,week` into an ordered list of dimensions; raises ValueError."""
+    if not value:
+        return []
+    requested = {part.strip() for part in value.split(',') if part.strip()}
+    unknown = requested - GROUP_BY_DIMENSIONS.keys()
+    if unknown:
+        raise ValueError(
+            f"Unknown group_by value(s): {', '.join(sorted(unknown))}. "
+            f"Use any of: {', '.join(GROUP_BY_DIMENSIONS)}"
+        )
+    return [dimension for dimension in GROUP_BY_DIMENSIONS if dimension in requested]
+
+
+def weekly_report_columns(group_by):
+    if not group_by:
+        return WEEKLY_REPORT_HEADERS, WEEKLY_REPORT_FIELDS
+    columns = [column for dimension in group_by for column in GROUP_BY_DIMENSIONS[dimension]]
+    headers = [header for header, _ in columns] + ["Quantité Consommée"]
+    fields = [field for _, field in columns] + ['total_used']
+    return headers, fields
+
+
+def weekly_report_values(reports, group_by):
+    """values_list over the reports, aggregated in SQL when `group_by` is given."""
+    _, fields = weekly_report_columns(group_by)
+    if not group_by:
+        return reports.values_list(*fields)
+    dimensions = fields[:-1]
+    ordering = ['-' + field if field in DATE_FIELDS else field for field in dimensions]
+    return (
+        reports
+        .values(*dimensions)
+        .annotate(total_used=Sum('quantity_used'))
+        .order_by(*ordering)
+        .values_list(*fields)
+    )
+
+
+def weekly_report_rows(values, fields):
+    """Yield export rows straight from a values_list cursor, without building model instances."""
+    date_columns = [i for i, field in enumerate(fields) if field in DATE_FIELDS]
+    for row in values.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        row = list(row)
+        for i in date_columns:
+            row[i] = row[i].strftime(EXPORT_DATE_FORMAT)
+        yield row
+
+
+def weekly_report_column_widths(reports):
+    """
+    Column widths for the raw export. Write-only worksheets emit column dimensions before the
+    first row, so the text widths come from one MAX(LENGTH()) aggregate instead of a second
+    pass over the cells.
+    """
+    lengths = reports.order_by().aggregate(
+        center__name=Max(Length('center__name')),
+        medicine__name=Max(Length('medicine__name')),
+        medicine__unit=Max(Length('medicine__unit')),
+        quantity_used=Max('quantity_used'),
+        observation=Max(Length('observation')),
+    )
+    lengths['quantity_used'] = len(str(lengths['quantity_used'] or ''))
+    lengths['week_start'] = lengths['week_end'] = len(date.today().strftime(EXPORT_DATE_FORMAT))
+    return [
+        max(len(header), lengths[field] or 0) + 2
+        for header, field in zip(WEEKLY_REPORT_HEADERS, WEEKLY_REPORT_FIELDS)
+    ]
+
+
+def write_xlsx(headers, rows, widths):
+    """
+    Write a sheet with a write-only workbook into a spooled temporary file and
+    return it rewound, ready to be streamed.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Weekly Consumption Report")
+
+    for i, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+
+    title = WriteOnlyCell(ws, value=f"Weekly Medicine Consumption Report - Generated {datetime.now().strftime('%Y-%m-%d %H:%M')}")
+    title.style = "Title"
+    ws.append([title])
+    ws.merged_cells.add(f"A1:{get_column_letter(len(headers) + 1)}1")
+    ws.append(headers)
+
+    for row in rows:
+        ws.append(row)
+
+    excel_file = tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_MAX_SIZE)
+    wb.save(excel_file)
+    excel_file.seek(0)
+    return excel_file
+
+
+def write_weekly_report_xlsx(reports, group_by=None):
+    headers, fields = weekly_report_columns(group_by)
+    values = weekly_report_values(reports, group_by)
+    if not group_by:
+        return write_xlsx(headers, weekly_report_rows(values, fields), weekly_report_column_widths(reports))
+
+    # Grouped results are small enough to size the columns from the rows themselves.
+    rows = list(weekly_report_rows(values, fields))
+    widths = [
+        max([len(header)] + [len(str(row[i])) for row in rows]) + 2
+        for i, header in enumerate(headers)
+    ]
+    return write_xlsx(headers, rows, widths)
+
+
+class _Echo:
+    """File-like object whose write() hands the line back, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def stream_weekly_report_csv(reports, group_by=None):
+    """Yield the export as CSV lines, one row at a time."""
+    headers, fields = weekly_report_columns(group_by)
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in weekly_report_rows(weekly_report_values(reports, group_by), fields):
+        yield writer.writerow(row)
+
+
+def parquet_available():
+    return (
+        importlib.util.find_spec('pyarrow') is not None
+        or importlib.util.find_spec('fastparquet') is not None
+    )
+
+
+def write_weekly_report_parquet(reports, group_by=None):
+    """
+    Build the export as a Parquet file from one columnar values_list fetch. Dates keep
+    their native type so downstream readers get typed columns.
+    """
+    headers, fields = weekly_report_columns(group_by)
+    values = weekly_report_values(reports, group_by)
+    df = pd.DataFrame.from_records(list(values.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)), columns=headers)
+    for header, field in zip(headers, fields):
+        if field in DATE_FIELDS:
+            df[header] = pd.to_datetime(df[header]).dt.date
+
+    parquet_file = tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_MAX_SIZE)
+    df.to_parquet(parquet_file, index=False)
+    parquet_file.seek(0)
+    return parquet_file
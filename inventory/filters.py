@@ -1,8 +1,46 @@
+from django.conf import settings
+from django.db.models import Q
 from django_filters import rest_framework as filters
-from .models import Stock, WeeklyConsumptionReport, MedicineReceipt
+from rest_framework.filters import SearchFilter
+from .catalogue import search as search_catalogue
+from .models import Medicine, Stock, WeeklyConsumptionReport, MedicineReceipt, MedicineBatch
+
+
+def catalogue_filter(model, field, terms):
+    """
+    Q for the rows whose `field` holds the id of a `model` row whose name contains every
+    term, ignoring case and accents, from the catalogue. A short term can match most of a
+    large catalogue: past CATALOGUE_SEARCH_MAX_IDS ids the names are matched by the database
+    instead, in a subquery served by the name indexes (accents then match as typed).
+    """
+    ids = search_catalogue(model, terms)
+    if len(ids) <= settings.CATALOGUE_SEARCH_MAX_IDS:
+        return Q(**{f"{field}__in": ids})
+    matching = model.objects.filter(*[Q(name__icontains=term) for term in terms]).values('pk')
+    return Q(**{f"{field}__in": matching})
+
+
+def filter_medicine_name(queryset, name, value):
+    """`medicine__name__icontains`, answered from the catalogue instead of a join and a scan."""
+    return queryset.filter(catalogue_filter(Medicine, 'medicine_id', [value]))
+
+
+class CatalogueSearchFilter(SearchFilter):
+    """
+    ?search= over a catalogue model's names (every term must appear, case-insensitively, as
+    with SearchFilter), matched in the process-local catalogue. Views set `catalogue_search`
+    to (model, id field), e.g. (Medicine, 'id') or (Medicine, 'medicine_id').
+    """
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        model, field = view.catalogue_search
+        return queryset.filter(catalogue_filter(model, field, terms))
+
 
 class StockFilter(filters.FilterSet):
-    medicine_name = filters.CharFilter(field_name='medicine__name', lookup_expr='icontains')
+    medicine_name = filters.CharFilter(method=filter_medicine_name)
     startDate = filters.DateFilter(field_name='last_updated', lookup_expr='gte')
     endDate = filters.DateFilter(field_name='last_updated', lookup_expr='lte')
     class Meta:
@@ -20,10 +58,22 @@ class WeeklyConsumptionReportFilter(filters.FilterSet):
 
 class MedicineReceiptFilter(filters.FilterSet):
     center = filters.NumberFilter(field_name='center__id')
-    medicine_name = filters.CharFilter(field_name='medicine__name', lookup_expr='icontains')
+    medicine_name = filters.CharFilter(method=filter_medicine_name)
     start_date = filters.DateFilter(field_name='received_date', lookup_expr='gte')
     end_date = filters.DateFilter(field_name='received_date', lookup_expr='lte')
 
     class Meta:
         model = MedicineReceipt
         fields = ['center', 'medicine_name', 'start_date', 'end_date']
+
+class MedicineBatchFilter(filters.FilterSet):
+    expiring_before = filters.DateFilter(field_name='exp_date', lookup_expr='lte')
+    non_empty = filters.BooleanFilter(method='filter_non_empty')
+
+    class Meta:
+        model = MedicineBatch
+        fields = ['center', 'medicine', 'expiring_before', 'non_empty']
+
+    def filter_non_empty(self, queryset, name, value):
+        # quantity > 0 is the predicate of the partial batch indexes, so keep it literal
+        return queryset.filter(quantity__gt=0) if value else queryset.filter(quantity=0)
@@ -0,0 +1,76 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+def request_fingerprint(request):
+    """Hash of what a request asks for, to refuse a key reused for a different request."""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode()).hexdigest()
+
+
+def idempotent(view_method, header='Idempotency-Key'):
+    """
+    Make a view method safe to retry: a request carrying an Idempotency-Key header is applied
+    once per user and key, and any later request with the same key gets the stored response
+    back (with an Idempotent-Replayed header) instead of being applied again.
+
+    The key row is inserted in the same transaction as the objects the request creates. A
+    concurrent retry blocks on the key's unique index until the first request commits and
+    then replays its response; if the first request fails, its key is rolled back with it
+    and may be reused.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(header)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return Response(
+                {"error": f"{header} must be at most 255 characters"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        fingerprint = request_fingerprint(request)
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(user=request.user, key=key, request_hash=fingerprint)
+            except IntegrityError:
+                return replay(IdempotencyKey.objects.get(user=request.user, key=key), fingerprint, header)
+
+            response = view_method(self, request, *args, **kwargs)
+            if status.is_success(response.status_code):
+                record.response_status = response.status_code
+                record.response_body = response.data
+                record.save(update_fields=['response_status', 'response_body'])
+            else:
+                # Nothing was applied: release the key so a corrected request can use it.
+                record.delete()
+            return response
+    return wrapper
+
+
+def replay(record, fingerprint, header):
+    if record.request_hash != fingerprint:
+        return Response(
+            {"error": f"This {header} was already used for a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+class IdempotentCreateMixin:
+    """Accept an Idempotency-Key header on `create`; see idempotent()."""
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
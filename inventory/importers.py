@@ -0,0 +1,361 @@
+from django.conf import settings
+from django.db import transaction, IntegrityError
+
+import pandas as pd
+
+from .cache import CENTERS, MEDICINES, RECEIPTS, REPORTS, bump_versions
+from .catalogue import name_key, resolve_names
+from .search import suggest
+from .models import (
+    MedicalCenter, Medicine, MedicineBatch, MedicineReceipt, WeeklyConsumptionReport,
+    allocate_fefo, apply_rollup_deltas, apply_stock_delta, apply_stock_deltas, generate_batch_code,
+    lock_batches, lock_stock, lock_stocks, stock_observation,
+)
+
+WEEKLY_REPORT_COLUMNS = [
+    'Date de début de semaine', 'Date de fin de semaine', 'Centre médical', 'Médicament', 'Quantité utilisée'
+]
+
+RECEIPT_COLUMNS = [
+    'Centre médical', 'Nom du Médicament', 'Unité', 'Quantité Reçue', 'Date de Réception', 'Date de Peramption'
+]
+
+
+def normalize_names(series):
+    """Vectorised version of catalogue.normalize_name."""
+    return series.astype(str).str.strip().str.replace('\u00a0', ' ', regex=False)
+
+
+def name_keys(series):
+    """catalogue.name_key of each name, computed once per distinct name."""
+    return series.map({name: name_key(name) for name in series.unique()})
+
+
+def missing_name_error(label, model, name, hints):
+    """
+    "<label> '<name>' does not exist", naming the closest existing name when there is one.
+    `hints` memoises the suggestions, as the same name is usually missing on many rows.
+    """
+    if name not in hints:
+        hints[name] = suggest(model, name)
+    error = f"{label} '{name}' does not exist"
+    return f"{error}. Did you mean '{hints[name]}'?" if hints[name] else error
+
+
+def parse_dates(series):
+    """
+    Parse a whole column day-first. Cells the inferred format cannot read are
+    retried individually, matching the old per-cell `pd.to_datetime(..., dayfirst=True)`.
+    """
+    parsed = pd.to_datetime(series, dayfirst=True, errors='coerce')
+    retry = parsed.isna() & series.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(series[retry], dayfirst=True, errors='coerce', format='mixed')
+    return parsed
+
+
+def _chunked_groups(groups, chunk_size):
+    """Yield lists of groups holding roughly `chunk_size` rows each."""
+    chunk, size = [], 0
+    for group in groups:
+        chunk.append(group)
+        size += len(group[1])
+        if size >= chunk_size:
+            yield chunk
+            chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+
+def import_weekly_reports(df, chunk_size=None, progress=None):
+    """
+    Create WeeklyConsumptionReport rows from an uploaded sheet.
+
+    Names are normalised and resolved once, the whole frame is validated up front,
+    then reports are created and consumption applied per (center, medicine) in
+    chunked transactions. Returns (success_count, errors) where errors carry the
+    sheet row number like the original row-by-row upload. `progress`, if given,
+    is called with the number of rows handled after validation and each chunk.
+    """
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    errors = []
+
+    frame = pd.DataFrame({
+        'row': df.index + 2,
+        'center_raw': df['Centre médical'],
+        'medicine_raw': df['Médicament'],
+        'center_name': normalize_names(df['Centre médical']),
+        'medicine_name': normalize_names(df['Médicament']),
+        'week_start': pd.to_datetime(df['Date de début de semaine'], errors='coerce'),
+        'week_end': pd.to_datetime(df['Date de fin de semaine'], errors='coerce'),
+        'quantity_used': pd.to_numeric(df['Quantité utilisée'], errors='coerce'),
+    })
+    frame['center_key'] = name_keys(frame['center_name'])
+    frame['medicine_key'] = name_keys(frame['medicine_name'])
+
+    center_ids = resolve_names(MedicalCenter, frame['center_name'].unique())
+    medicine_ids = resolve_names(Medicine, frame['medicine_name'].unique())
+
+    # Whole-frame validation: every failing row gets exactly one error, first failure wins.
+    center_hints, medicine_hints = {}, {}
+    checks = [
+        (~frame['center_key'].isin(center_ids.keys()),
+         lambda r: missing_name_error("MedicalCenter", MedicalCenter, r.center_raw, center_hints)),
+        (~frame['medicine_key'].isin(medicine_ids.keys()),
+         lambda r: missing_name_error("Medicine", Medicine, r.medicine_raw, medicine_hints)),
+        (frame['week_start'].isna() | frame['week_end'].isna(),
+         lambda r: "Invalid week start or end date"),
+        (frame['quantity_used'].isna() | (frame['quantity_used'] < 0),
+         lambda r: "Quantité utilisée must be a number, zero or more"),
+    ]
+    invalid = pd.Series(False, index=frame.index)
+    for mask, message in checks:
+        for r in frame[mask & ~invalid].itertuples():
+            errors.append({"row": r.row, "error": message(r)})
+        invalid |= mask
+
+    valid = frame[~invalid].copy()
+    if valid.empty:
+        errors.sort(key=lambda error: error["row"])
+        return 0, errors
+
+    valid['center_id'] = valid['center_key'].map(center_ids)
+    valid['medicine_id'] = valid['medicine_key'].map(medicine_ids)
+    valid['week_start'] = valid['week_start'].dt.date
+    valid['week_end'] = valid['week_end'].dt.date
+    valid['quantity_used'] = valid['quantity_used'].astype(int)
+
+    created, create_errors = create_weekly_reports(
+        valid,
+        MedicalCenter.objects.in_bulk(valid['center_id'].unique().tolist()),
+        Medicine.objects.in_bulk(valid['medicine_id'].unique().tolist()),
+        chunk_size=chunk_size,
+        progress=progress,
+        rows_done=len(frame) - len(valid),
+    )
+    errors.extend(create_errors)
+    errors.sort(key=lambda error: error["row"])
+    return len(created), errors
+
+
+def create_weekly_reports(valid, centers, medicines, chunk_size=None, progress=None, rows_done=0):
+    """
+    Create validated reports and apply their consumption. `valid` has row, center_id,
+    medicine_id, week_start, week_end (dates) and quantity_used (int) columns; `centers`
+    and `medicines` map ids to instances. Rows repeating a report of the frame or of the
+    database are rejected, the rest are created per (center, medicine) in chunked
+    transactions. Returns ({row: report}, errors); errors are not sorted.
+    """
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    errors = []
+    if valid.empty:
+        return {}, errors
+
+    key_columns = ['week_start', 'week_end', 'center_id', 'medicine_id']
+    duplicated = valid.duplicated(subset=key_columns, keep='first')
+    existing = set(
+        WeeklyConsumptionReport.objects
+        .filter(
+            center_id__in=valid['center_id'].unique().tolist(),
+            medicine_id__in=valid['medicine_id'].unique().tolist(),
+            week_start__in=valid['week_start'].unique().tolist(),
+        )
+        .values_list(*key_columns)
+    )
+    already_reported = valid[key_columns].apply(tuple, axis=1).isin(existing)
+    for r in valid[duplicated | already_reported].itertuples():
+        errors.append({"row": r.row, "error": "A report for this week, center and medicine already exists"})
+    valid = valid[~(duplicated | already_reported)]
+
+    rows_done += int((duplicated | already_reported).sum())
+    if progress:
+        progress(rows_done)
+    # Pairs in id order: a chunk holds several pair locks, and concurrent imports (and
+    # lock_stocks) must take them in the same order.
+    groups = valid.sort_values(['week_start', 'row']).groupby(['center_id', 'medicine_id'])
+    created = {}
+    for chunk in _chunked_groups(groups, chunk_size):
+        with transaction.atomic():
+            for (center_id, medicine_id), rows in chunk:
+                group_created, group_errors = _create_report_group(centers[center_id], medicines[medicine_id], rows)
+                created.update(group_created)
+                errors.extend(group_errors)
+                rows_done += len(rows)
+        if progress:
+            progress(rows_done)
+
+    return created, errors
+
+
+def _create_report_group(center, medicine, rows):
+    """
+    Create the reports of one (center, medicine) pair and consume their total once.
+    Returns ({row: report}, errors).
+    """
+    errors = []
+    accepted = []
+    try:
+        with transaction.atomic():
+            lock_stock(center, medicine)
+            batches = lock_batches(center, medicine)
+            available = sum(batch.quantity for batch in batches)
+
+            used = 0
+            for r in rows.itertuples():
+                if used + r.quantity_used > available:
+                    errors.append({
+                        "row": r.row,
+                        "error": f"Not enough stock to consume {r.quantity_used} units of {medicine}",
+                    })
+                    continue
+                used += r.quantity_used
+                accepted.append(r)
+
+            if not accepted:
+                return {}, errors
+
+            touched, _ = allocate_fefo(batches, used)
+            if touched:
+                MedicineBatch.objects.bulk_update(touched, ["quantity"])
+            total = apply_stock_delta(center, medicine, -used)
+
+            # Each report records the stock left right after its own consumption.
+            reports = []
+            remaining_after = total
+            for r in reversed(accepted):
+                reports.append(WeeklyConsumptionReport(
+                    week_start=r.week_start,
+                    week_end=r.week_end,
+                    center=center,
+                    medicine=medicine,
+                    quantity_used=r.quantity_used,
+                    observation=stock_observation(remaining_after),
+                ))
+                remaining_after += r.quantity_used
+            reports.reverse()
+            WeeklyConsumptionReport.objects.bulk_create(reports)
+            rollup_deltas = {}
+            for report in reports:
+                key = (center.id, medicine.id, report.week_start)
+                rollup_deltas[key] = rollup_deltas.get(key, 0) + report.quantity_used
+            apply_rollup_deltas(rollup_deltas)
+            bump_versions(REPORTS)
+    except IntegrityError as e:
+        return {}, errors + [{"row": r.row, "error": str(e)} for r in accepted]
+    return {r.row: report for r, report in zip(accepted, reports)}, errors
+
+
+def create_medicine_receipts(frame, centers, medicines):
+    """
+    Create validated receipts with their batches and add them to Stock, in one transaction.
+    `frame` has center_id, medicine_id, quantity (int), received_date and exp_date (dates or
+    None) columns; `centers` and `medicines` map ids to instances. Receipts and batches are
+    bulk-created and Stock is updated once per (center, medicine). Returns the receipts in
+    frame order.
+    """
+    deltas = frame.groupby(['center_id', 'medicine_id'])['quantity'].sum()
+    with transaction.atomic():
+        # Lock the stock rows before the batches exist, so rows created by the lock start
+        # from the previous batch totals and the deltas below are applied exactly once.
+        lock_stocks(deltas.index.tolist())
+
+        receipts = []
+        batches = []
+        for r in frame.itertuples():
+            center = centers[r.center_id]
+            medicine = medicines[r.medicine_id]
+            receipts.append(MedicineReceipt(
+                center=center,
+                medicine=medicine,
+                quantity_received=r.quantity,
+                exp_date=r.exp_date,
+                received_date=r.received_date,
+            ))
+            batches.append(MedicineBatch(
+                center=center,
+                medicine=medicine,
+                quantity=r.quantity,
+                exp_date=r.exp_date,
+                received_date=r.received_date,
+                batch_code=generate_batch_code(),
+            ))
+        MedicineReceipt.objects.bulk_create(receipts, batch_size=1000)
+        MedicineBatch.objects.bulk_create(batches, batch_size=1000)
+        bump_versions(RECEIPTS)
+        apply_stock_deltas({key: int(total) for key, total in deltas.items()})
+    return receipts
+
+
+def import_medicine_receipts(df, progress=None):
+    """
+    Create MedicineReceipt rows (and their batches) from an uploaded sheet, all or nothing.
+
+    Dates are parsed column-wise, missing centers and medicines are created in bulk,
+    receipts and batches are bulk-created and Stock is updated once per
+    (center, medicine). Returns (created_count, errors); nothing is written when
+    any row is invalid.
+    """
+    errors = []
+    frame = pd.DataFrame({
+        'row': df.index + 2,
+        'center_name': normalize_names(df['Centre médical']),
+        'medicine_name': normalize_names(df['Nom du Médicament']),
+        'unit': df['Unité'].fillna('').astype(str).str.strip(),
+        'quantity': pd.to_numeric(df['Quantité Reçue'], errors='coerce'),
+        'received_date': parse_dates(df['Date de Réception']),
+        'exp_date': parse_dates(df['Date de Peramption']),
+    })
+
+    checks = [
+        (frame['quantity'].isna() | (frame['quantity'] < 0),
+         "Quantité Reçue must be a number, zero or more"),
+        (frame['received_date'].isna(),
+         "Invalid Date de Réception"),
+        (frame['exp_date'].isna() & df['Date de Peramption'].notna(),
+         "Invalid Date de Peramption"),
+    ]
+    invalid = pd.Series(False, index=frame.index)
+    for mask, message in checks:
+        errors.extend({"row": row, "error": message} for row in frame.loc[mask & ~invalid, 'row'])
+        invalid |= mask
+    if errors:
+        errors.sort(key=lambda error: error["row"])
+        return 0, errors
+
+    frame['quantity'] = frame['quantity'].astype(int)
+    frame['received_date'] = frame['received_date'].dt.date
+    frame['exp_date'] = frame['exp_date'].dt.date.where(frame['exp_date'].notna(), None)
+
+    # Names are matched ignoring case and accents through the catalogue; a name seen for the
+    # first time creates its center or medicine, spelled (and, for medicines, united) as its first row.
+    frame['center_key'] = name_keys(frame['center_name'])
+    frame['medicine_key'] = name_keys(frame['medicine_name'])
+    with transaction.atomic():
+        center_ids = resolve_names(MedicalCenter, frame['center_name'].unique())
+        new_centers = [
+            MedicalCenter(name=r.center_name)
+            for r in frame.drop_duplicates('center_key').itertuples() if r.center_key not in center_ids
+        ]
+        center_ids.update((name_key(c.name), c.id) for c in MedicalCenter.objects.bulk_create(new_centers))
+
+        medicine_ids = resolve_names(Medicine, frame['medicine_name'].unique())
+        new_medicines = [
+            Medicine(name=r.medicine_name, unit=r.unit)
+            for r in frame.drop_duplicates('medicine_key').itertuples() if r.medicine_key not in medicine_ids
+        ]
+        medicine_ids.update((name_key(m.name), m.id) for m in Medicine.objects.bulk_create(new_medicines))
+
+        bump_versions(CENTERS, MEDICINES)
+
+        frame['center_id'] = frame['center_key'].map(center_ids)
+        frame['medicine_id'] = frame['medicine_key'].map(medicine_ids)
+        receipts = create_medicine_receipts(
+            frame,
+            MedicalCenter.objects.in_bulk(list(center_ids.values())),
+            Medicine.objects.in_bulk(list(medicine_ids.values())),
+        )
+
+    if progress:
+        progress(len(frame))
+
+    return len(receipts), errors
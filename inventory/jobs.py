@@ -0,0 +1,108 @@
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+import pandas as pd
+
+from .importers import (
+    RECEIPT_COLUMNS, WEEKLY_REPORT_COLUMNS,
+    import_medicine_receipts, import_weekly_reports,
+)
+from .models import ImportJob
+
+IMPORTERS = {
+    ImportJob.WEEKLY_REPORTS: (WEEKLY_REPORT_COLUMNS, import_weekly_reports),
+    ImportJob.RECEIPTS: (RECEIPT_COLUMNS, import_medicine_receipts),
+}
+
+
+def enqueue_import(kind, file, user):
+    """Stage an uploaded sheet for the background worker and return its ImportJob."""
+    return ImportJob.objects.create(
+        kind=kind,
+        created_by=user if user.is_authenticated else None,
+        file_name=file.name,
+        file_content=file.read(),
+    )
+
+
+def reclaim_stale_jobs():
+    """
+    Recover the jobs a dead worker left running for over IMPORT_JOB_TIMEOUT_MINUTES.
+    Weekly reports go back to the queue: the rerun rejects the reports already imported
+    as duplicates. A receipt import commits in one transaction that may or may not have
+    happened, so it is failed instead, for its receipts to be checked before a new upload.
+    Returns the number of jobs recovered.
+    """
+    now = timezone.now()
+    stale = ImportJob.objects.filter(
+        status=ImportJob.RUNNING,
+        started_at__lt=now - timedelta(minutes=settings.IMPORT_JOB_TIMEOUT_MINUTES),
+    )
+    requeued = stale.filter(kind=ImportJob.WEEKLY_REPORTS).update(status=ImportJob.PENDING, started_at=None)
+    failed = stale.exclude(kind=ImportJob.WEEKLY_REPORTS).update(
+        status=ImportJob.FAILED,
+        finished_at=now,
+        message="The worker stopped before the import finished; check the receipts before uploading again.",
+    )
+    return requeued + failed
+
+
+def claim_next_job():
+    """
+    Atomically move the oldest pending job to running, after reclaiming stale ones. SKIP
+    LOCKED lets several workers poll the same table without blocking on, or double-claiming, a job.
+    """
+    reclaim_stale_jobs()
+    with transaction.atomic():
+        job = (
+            ImportJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=ImportJob.PENDING)
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = ImportJob.RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+        return job
+
+
+def run_import_job(job):
+    columns, importer = IMPORTERS[job.kind]
+
+    def progress(rows_processed):
+        ImportJob.objects.filter(pk=job.pk).update(rows_processed=rows_processed)
+
+    try:
+        df = pd.read_excel(BytesIO(job.file_content))
+        job.rows_total = len(df)
+        job.save(update_fields=['rows_total'])
+
+        if not all(col in df.columns for col in columns):
+            raise ValueError("Excel file must contain these columns: " + ", ".join(columns))
+
+        success_count, errors = importer(df, progress=progress)
+    except Exception as e:
+        # rows_processed is left as the importer's progress callback last wrote it.
+        job.status = ImportJob.FAILED
+        job.message = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'message', 'finished_at'])
+    else:
+        job.status = ImportJob.DONE
+        job.success_count = success_count
+        job.errors = errors
+        job.rows_processed = job.rows_total
+        job.message = f"Successfully imported {success_count} of {job.rows_total} rows."
+        job.file_content = b''
+        job.finished_at = timezone.now()
+        job.save(update_fields=[
+            'status', 'success_count', 'errors', 'rows_processed', 'message', 'file_content', 'finished_at',
+        ])
+    return job
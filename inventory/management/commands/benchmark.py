@@ -0,0 +1,239 @@
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.text import compress_string
+
+from rest_framework.renderers import JSONRenderer
+
+from inventory.analytics import services as analytics
+from inventory.cache import DASHBOARD_TABLES, bump_versions
+from inventory.exports import stream_weekly_report_csv, write_weekly_report_xlsx
+from inventory.middleware import brotli, brotli_available
+from inventory.models import (
+    MedicalCenter, Medicine, MedicineBatch, MedicineReceipt, Stock, WeeklyConsumptionReport, apply_rollup_deltas,
+)
+from inventory.renderers import FastJSONRenderer, orjson_available
+from inventory.search import TrigramIndex
+from inventory.serializers import MedicineSerializer, ValuesSerializer
+from inventory.views import DashboardAnalyticsView
+
+
+class Command(BaseCommand):
+    help = (
+        "Time hot code paths against a synthetic data set. The data is created inside a "
+        "transaction that is rolled back, so the database is left untouched."
+    )
+
+    targets = ['analytics', 'renderer', 'compression', 'search']
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', choices=self.targets)
+        parser.add_argument('--reports', type=int, default=100_000, help="Weekly reports to seed (default 100000).")
+        parser.add_argument('--centers', type=int, default=20)
+        parser.add_argument('--weeks', type=int, default=50)
+        parser.add_argument('--batches', type=int, default=200_000, help="Batches to seed (default 200000).")
+        parser.add_argument(
+            '--medicines', type=int, default=None,
+            help="Catalogue size (default 2000, or 50000 for the search target).",
+        )
+        parser.add_argument('--repeat', type=int, default=5, help="Timed calls per case (default 5).")
+
+    def handle(self, *args, **options):
+        getattr(self, f"benchmark_{options['target']}")(options)
+
+    def time_cases(self, cases, repeat):
+        """Run each (label, callable) once to warm up, then `repeat` timed calls; print median and max."""
+        for label, func in cases:
+            func()
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                func()
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{label:<40} median {statistics.median(timings):8.1f} ms   max {max(timings):8.1f} ms"
+            )
+
+    def seed_reports(self, reports, centers, weeks):
+        """Centers x medicines x weeks of reports, with matching stock rows and weekly rollups."""
+        medicines = max(reports // (centers * weeks), 1)
+        center_objs = MedicalCenter.objects.bulk_create([
+            MedicalCenter(name=f"Benchmark center {i}") for i in range(centers)
+        ])
+        medicine_objs = Medicine.objects.bulk_create([
+            Medicine(name=f"Benchmark medicine {i}", unit="cp") for i in range(medicines)
+        ])
+        Stock.objects.bulk_create([
+            Stock(center=center, medicine=medicine, total_quantity=(center.id * medicine.id) % 500)
+            for center in center_objs for medicine in medicine_objs
+        ], batch_size=5000)
+
+        first_week = analytics.week_monday(date.today()) - timedelta(weeks=weeks - 1)
+        rows = [
+            WeeklyConsumptionReport(
+                center=center, medicine=medicine,
+                week_start=first_week + timedelta(weeks=week),
+                week_end=first_week + timedelta(weeks=week, days=6),
+                quantity_used=(center.id + medicine.id + week) % 40,
+            )
+            for center in center_objs for medicine in medicine_objs for week in range(weeks)
+        ]
+        WeeklyConsumptionReport.objects.bulk_create(rows, batch_size=5000)
+        apply_rollup_deltas({
+            (row.center.id, row.medicine.id, row.week_start): row.quantity_used for row in rows
+        })
+        return len(rows)
+
+    def seed_batches(self, count):
+        """`count` batches spread over the seeded centers and medicines, expiring over the next year."""
+        centers = list(MedicalCenter.objects.filter(name__startswith="Benchmark ").values_list('id', flat=True))
+        medicines = list(Medicine.objects.filter(name__startswith="Benchmark ").values_list('id', flat=True))
+        today = date.today()
+        MedicineBatch.objects.bulk_create([
+            MedicineBatch(
+                center_id=centers[i % len(centers)],
+                medicine_id=medicines[(i // len(centers)) % len(medicines)],
+                quantity=(i * 7) % 200,
+                exp_date=today + timedelta(days=(i * 13) % 400 - 30),
+                batch_code=f"BENCH-{i}",
+            )
+            for i in range(count)
+        ], batch_size=5000)
+
+    def benchmark_analytics(self, options):
+        with transaction.atomic():
+            started = time.perf_counter()
+            seeded = self.seed_reports(options['reports'], options['centers'], options['weeks'])
+            self.seed_batches(options['batches'])
+            self.stdout.write(
+                f"Seeded {seeded} weekly reports and {options['batches']} batches "
+                f"in {time.perf_counter() - started:.1f} s"
+            )
+
+            since = date.today() - timedelta(weeks=4)
+            self.time_cases([
+                ("consumption per center", analytics.get_total_consumed_per_center),
+                ("consumption per center (4 weeks)", lambda: analytics.get_total_consumed_per_center(since)),
+                ("stock per center", analytics.get_total_stock_per_center),
+                ("top medicines", analytics.get_top_medicines),
+                ("top medicines (4 weeks)", lambda: analytics.get_top_medicines(5, since)),
+                ("consumption velocity (8 weeks)", analytics.get_consumption_velocity),
+                ("consumption velocity (26 weeks)", lambda: analytics.get_consumption_velocity(26)),
+                ("stock-out forecast (cold cache)", lambda: (cache.clear(), analytics.forecast_stock_out())),
+                ("stock-out forecast (cached)", analytics.forecast_stock_out),
+                ("expiry risk summary (cold cache)", lambda: (cache.clear(), analytics.get_expiry_risk_summary(30))),
+                ("expiry risk summary (cached)", lambda: analytics.get_expiry_risk_summary(30)),
+                ("expiry risk, all batches (cached)", lambda: analytics.get_expiry_risk(30)),
+            ], options['repeat'])
+
+            transaction.set_rollback(True)
+        bump_versions(*DASHBOARD_TABLES)  # results cached from the rolled-back data
+
+    def api_payloads(self, options):
+        """
+        Seed reports, batches, a medicine catalogue and receipts, and return the largest API
+        payloads as data: the dashboard, the dashboard with ?include=receipts and the catalogue.
+        """
+        self.seed_reports(options['reports'], options['centers'], options['weeks'])
+        self.seed_batches(options['batches'])
+        Medicine.objects.bulk_create([
+            Medicine(name=f"Catalogue medicine {i}", unit="cp") for i in range(options['medicines'] or 2_000)
+        ], batch_size=5000)
+        MedicineReceipt.objects.bulk_create([
+            MedicineReceipt(
+                center_id=stock.center_id, medicine_id=stock.medicine_id, quantity_received=10,
+                received_date=date.today() - timedelta(days=i % 365), exp_date=date.today() + timedelta(days=i % 700),
+            )
+            for i, stock in enumerate(Stock.objects.all()[:settings.DASHBOARD_RECEIPTS_LIMIT])
+        ], batch_size=5000)
+
+        view = DashboardAnalyticsView()
+        dashboard = view.build_dashboard()
+        with_receipts = {**dashboard, "tables": {**dashboard["tables"], "Receipts": view.build_receipts_table()}}
+        reader = ValuesSerializer(MedicineSerializer)
+        catalogue = reader.to_representation(reader.values(Medicine.objects.all()))
+        return {"dashboard": dashboard, "dashboard+receipts": with_receipts, "catalogue": catalogue}
+
+    def benchmark_renderer(self, options):
+        if not orjson_available():
+            self.stdout.write(self.style.WARNING("orjson is not installed: FastJSONRenderer falls back to JSONRenderer."))
+        with transaction.atomic():
+            payloads = self.api_payloads(options)
+            transaction.set_rollback(True)
+        bump_versions(*DASHBOARD_TABLES)  # results cached from the rolled-back data
+
+        cases = []
+        for label, payload in payloads.items():
+            size = len(JSONRenderer().render(payload))
+            self.stdout.write(f"{label} payload: {size / 1024:.0f} KiB")
+            cases += [
+                (f"{label}, JSONRenderer", lambda payload=payload: JSONRenderer().render(payload)),
+                (f"{label}, FastJSONRenderer", lambda payload=payload: FastJSONRenderer().render(payload)),
+            ]
+        self.time_cases(cases, options['repeat'])
+
+    def benchmark_compression(self, options):
+        """Bytes saved and time spent by each encoding CompressionMiddleware can pick."""
+        with transaction.atomic():
+            bodies = {
+                f"{label} (json)": FastJSONRenderer().render(payload)
+                for label, payload in self.api_payloads(options).items()
+            }
+            reports = WeeklyConsumptionReport.objects.order_by('-week_start')
+            bodies["weekly export (csv)"] = "".join(stream_weekly_report_csv(reports)).encode()
+            with write_weekly_report_xlsx(reports) as xlsx:
+                bodies["weekly export (xlsx)"] = xlsx.read()
+            transaction.set_rollback(True)
+        bump_versions(*DASHBOARD_TABLES)  # results cached from the rolled-back data
+
+        encoders = [("gzip", compress_string)]
+        if brotli_available():
+            quality = settings.COMPRESSION_BROTLI_QUALITY
+            encoders.append((f"br q{quality}", lambda body: brotli.compress(body, quality=quality)))
+        else:
+            self.stdout.write(self.style.WARNING("brotli is not installed: only gzip is measured."))
+
+        cases = []
+        for label, body in bodies.items():
+            sizes = "   ".join(
+                f"{name} {len(encode(body)) / 1024:8.0f} KiB ({len(encode(body)) / len(body):4.0%})"
+                for name, encode in encoders
+            )
+            self.stdout.write(f"{label:<28} {len(body) / 1024:8.0f} KiB   {sizes}")
+            cases += [
+                (f"{label}, {name}", lambda body=body, encode=encode: encode(body)) for name, encode in encoders
+            ]
+        self.time_cases(cases, options['repeat'])
+
+    def benchmark_search(self, options):
+        """Trigram index build and /medicines/search/ lookups over a catalogue of --medicines names."""
+        count = options['medicines'] or 50_000
+        stems = ["Paracétamol", "Amoxicilline", "Ibuprofène", "Métronidazole", "Artéméther", "Cotrimoxazole",
+                 "Quinine", "Oméprazole", "Céftriaxone", "Doxycycline", "Salbutamol", "Fer acide folique"]
+        forms = ["cp", "gél", "sirop", "inj", "susp", "pommade"]
+        with transaction.atomic():
+            Medicine.objects.bulk_create([
+                Medicine(
+                    name=f"{stems[i % len(stems)]} {(i // len(stems)) % 1000 + 1}mg {forms[i % len(forms)]} #{i}",
+                    unit=forms[i % len(forms)],
+                )
+                for i in range(count)
+            ], batch_size=5000)
+            rows = list(Medicine.objects.order_by('-id').values_list('id', 'name'))
+            transaction.set_rollback(True)
+
+        started = time.perf_counter()
+        index = TrigramIndex(rows)
+        self.stdout.write(f"Indexed {len(rows)} medicines in {(time.perf_counter() - started) * 1000:.0f} ms")
+        self.time_cases([
+            ("prefix 'parac'", lambda: index.search("parac")),
+            ("no accent 'metronidazole 250'", lambda: index.search("metronidazole 250")),
+            ("typo 'amoxiciline 500mg'", lambda: index.search("amoxiciline 500mg")),
+            ("upper case 'IBUPROFENE SIROP'", lambda: index.search("IBUPROFENE SIROP")),
+            ("no match 'zzzz'", lambda: index.search("zzzz")),
+        ], options['repeat'])
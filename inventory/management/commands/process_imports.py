@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.jobs import claim_next_job, run_import_job
+
+
+class Command(BaseCommand):
+    help = "Run queued Excel imports. Polls the ImportJob table; no external broker required."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=2.0,
+            help="Seconds to sleep when the queue is empty.",
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Exit once the queue is empty instead of polling forever.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["interval"])
+                continue
+
+            self.stdout.write(f"Running import job {job.pk} ({job.kind}, {job.file_name})")
+            job = run_import_job(job)
+            self.stdout.write(f"Import job {job.pk} {job.status} in {job.duration:.2f}s: {job.message}")
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from inventory.models import SyncTombstone
+
+
+class Command(BaseCommand):
+    help = "Delete /sync/ tombstones older than SYNC_TOMBSTONE_DAYS; older tokens already get a full resync."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+        deleted, _ = SyncTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} sync tombstones."))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from inventory.cache import REPORTS, bump_versions
+from inventory.models import ConsumptionRollup, WeeklyConsumptionReport
+
+
+class Command(BaseCommand):
+    help = "Rebuild the weekly and monthly consumption rollups from WeeklyConsumptionReport."
+
+    def handle(self, *args, **options):
+        periods = [
+            (ConsumptionRollup.WEEK, TruncWeek('week_start')),
+            (ConsumptionRollup.MONTH, TruncMonth('week_start')),
+        ]
+        with transaction.atomic():
+            ConsumptionRollup.objects.all().delete()
+            for period, trunc in periods:
+                rows = (
+                    WeeklyConsumptionReport.objects
+                    .annotate(period_start=trunc)
+                    .values('center_id', 'medicine_id', 'period_start')
+                    .annotate(total=Sum('quantity_used'))
+                    .order_by()
+                )
+                created = ConsumptionRollup.objects.bulk_create([
+                    ConsumptionRollup(
+                        center_id=row['center_id'],
+                        medicine_id=row['medicine_id'],
+                        period=period,
+                        period_start=row['period_start'],
+                        quantity_used=row['total'],
+                    )
+                    for row in rows
+                ], batch_size=1000)
+                self.stdout.write(f"{len(created)} {period} rollups")
+            # Dashboard and analytics results built from the rollups are keyed on this version.
+            bump_versions(REPORTS)
+
+        self.stdout.write(self.style.SUCCESS("Consumption rollups rebuilt."))
@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+re_accepts_brotli = _lazy_re_compile(r"\bbr\b")
+
+
+def brotli_available():
+    return brotli is not None
+
+
+def compressible(response):
+    """
+    False for responses not worth compressing: already encoded, of an excluded content type
+    (COMPRESSION_EXCLUDED_TYPES; entries ending in '/' match the whole family), or shorter
+    than COMPRESSION_MIN_SIZE. Streaming responses only know their size when they set a
+    Content-Length (FileResponse does), otherwise they are compressed.
+    """
+    if response.has_header('Content-Encoding'):
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    for excluded in settings.COMPRESSION_EXCLUDED_TYPES:
+        if content_type == excluded or (excluded.endswith('/') and content_type.startswith(excluded)):
+            return False
+    if response.streaming:
+        length = response.get('Content-Length')
+        return length is None or int(length) >= settings.COMPRESSION_MIN_SIZE
+    return len(response.content) >= settings.COMPRESSION_MIN_SIZE
+
+
+def brotli_allowed(request, response):
+    """
+    False for responses that may carry a secret next to what the client sent: those setting
+    cookies, and anything under COMPRESSION_BROTLI_EXCLUDED_PATHS (tokens from /api/auth/,
+    CSRF tokens in the admin). Brotli has no equivalent of the random gzip header padding
+    Django adds against BREACH, so these are gzipped instead.
+    """
+    if response.cookies:
+        return False
+    return not any(request.path.startswith(path) for path in settings.COMPRESSION_BROTLI_EXCLUDED_PATHS)
+
+
+def brotli_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress API responses and exports, streamed CSV included, for clients on slow links.
+
+    Brotli is used when it is installed, the client accepts it and `brotli_allowed`, gzip
+    otherwise (Django's GZipMiddleware, with its BREACH padding). Only responses passing
+    `compressible` are touched, so Parquet exports, which are compressed already, go out as
+    they are.
+    """
+    def process_response(self, request, response):
+        if not compressible(response):
+            return response
+
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if (
+            brotli is None or (response.streaming and response.is_async)
+            or not re_accepts_brotli.search(accept_encoding) or not brotli_allowed(request, response)
+        ):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        quality = settings.COMPRESSION_BROTLI_QUALITY
+        if response.streaming:
+            response.streaming_content = brotli_sequence(response.streaming_content, quality)
+            del response.headers['Content-Length']
+        else:
+            compressed_content = brotli.compress(response.content, quality=quality)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
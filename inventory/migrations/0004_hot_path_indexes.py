@@ -0,0 +1,87 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:55
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+TRIGRAM_INDEXES = [
+    ("center_name_trgm_idx", "inventory_medicalcenter"),
+    ("medicine_name_trgm_idx", "inventory_medicine"),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    GIN trigram indexes for the icontains searches, which PostgreSQL compiles to
+    UPPER(name) LIKE UPPER(%s). Skipped on other databases and where pg_trgm is unavailable.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" USING gin (UPPER("name") gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0003_importjob"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="medicalcenter",
+            index=models.Index(
+                django.db.models.functions.text.Upper("name"),
+                name="center_upper_name_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="medicine",
+            index=models.Index(
+                django.db.models.functions.text.Upper("name"),
+                name="medicine_upper_name_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="medicinebatch",
+            index=models.Index(
+                condition=models.Q(("quantity__gt", 0)),
+                fields=["center", "medicine", "exp_date"],
+                name="batch_fefo_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="medicinereceipt",
+            index=models.Index(
+                fields=["-received_date", "id"], name="receipt_received_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stock",
+            index=models.Index(
+                fields=["total_quantity"], name="stock_total_quantity_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="weeklyconsumptionreport",
+            index=models.Index(fields=["-week_end", "id"], name="report_week_end_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="weeklyconsumptionreport",
+            index=models.Index(fields=["week_start"], name="report_week_start_idx"),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
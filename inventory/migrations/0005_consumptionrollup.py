@@ -0,0 +1,90 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+
+def build_rollups(apps, schema_editor):
+    """Seed the rollups from the reports already recorded (same as `rebuild_rollups`)."""
+    ConsumptionRollup = apps.get_model("inventory", "ConsumptionRollup")
+    WeeklyConsumptionReport = apps.get_model("inventory", "WeeklyConsumptionReport")
+    for period, trunc in [
+        ("week", TruncWeek("week_start")),
+        ("month", TruncMonth("week_start")),
+    ]:
+        rows = (
+            WeeklyConsumptionReport.objects.annotate(period_start=trunc)
+            .values("center_id", "medicine_id", "period_start")
+            .annotate(total=Sum("quantity_used"))
+            .order_by()
+        )
+        ConsumptionRollup.objects.bulk_create(
+            [
+                ConsumptionRollup(
+                    center_id=row["center_id"],
+                    medicine_id=row["medicine_id"],
+                    period=period,
+                    period_start=row["period_start"],
+                    quantity_used=row["total"],
+                )
+                for row in rows
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0004_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConsumptionRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("week", "ISO week"), ("month", "Month")], max_length=5
+                    ),
+                ),
+                ("period_start", models.DateField()),
+                ("quantity_used", models.PositiveIntegerField(default=0)),
+                (
+                    "center",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="inventory.medicalcenter",
+                    ),
+                ),
+                (
+                    "medicine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="inventory.medicine",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["period", "period_start"], name="rollup_period_idx"
+                    )
+                ],
+                "unique_together": {("center", "medicine", "period", "period_start")},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0005_consumptionrollup"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="medicinebatch",
+            index=models.Index(
+                condition=models.Q(("quantity__gt", 0)),
+                fields=["exp_date"],
+                name="batch_expiry_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0007_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="medicalcenter",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name="medicine",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name="stock",
+            name="last_updated",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name="SyncTombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "model",
+                    models.CharField(
+                        choices=[
+                            ("center", "Medical center"),
+                            ("medicine", "Medicine"),
+                            ("stock", "Stock"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("object_id", models.BigIntegerField()),
+                ("deleted_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["model", "deleted_at"],
+                        name="inventory_s_model_1e740a_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:39
+
+import time
+
+from django.db import migrations, models
+
+
+def create_versions(apps, schema_editor):
+    TableVersion = apps.get_model("inventory", "TableVersion")
+    TableVersion.objects.bulk_create(
+        [
+            TableVersion(table=table, version=time.time_ns())
+            for table in ["centers", "medicines", "stock", "receipts", "reports"]
+        ],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("inventory", "0008_sync_tracking"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TableVersion",
+            fields=[
+                (
+                    "table",
+                    models.CharField(max_length=20, primary_key=True, serialize=False),
+                ),
+                ("version", models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,13 @@
 import uuid
+from collections import namedtuple
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models.functions import Greatest, Upper
 from django.utils import timezone
-from django.db import transaction
-from datetime import date
+from django.db import connection, transaction, IntegrityError
+from datetime import date, timedelta
+
+from .cache import STOCK, bump_versions
 
 class RegistrationCode(models.Model):
     email = models.EmailField(unique=True)
@@ -28,6 +32,13 @@ class UserProfile(models.Model):
 
 class MedicalCenter(models.Model):
     name = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # iexact lookups compile to UPPER(name) = UPPER(%s)
+            models.Index(Upper('name'), name='center_upper_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -35,10 +46,19 @@ class MedicalCenter(models.Model):
 class Medicine(models.Model):
     name = models.CharField(max_length=100)
     unit = models.CharField(max_length=20)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(Upper('name'), name='medicine_upper_name_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.unit})"
 
+def generate_batch_code():
+    return f"BATCH-{uuid.uuid4().hex[:8]}"
+
 class MedicineBatch(models.Model):
     medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
     center = models.ForeignKey(MedicalCenter, on_delete=models.CASCADE)
@@ -57,15 +77,29 @@ class MedicineBatch(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.batch_code:
-            self.batch_code = f"BATCH-{uuid.uuid4().hex[:8]}"
+            self.batch_code = generate_batch_code()
         super().save(*args, **kwargs)
 
     class Meta:
         ordering = ['exp_date']
+        indexes = [
+            # FEFO consumption: non-empty batches of a center/medicine by expiry
+            models.Index(
+                fields=['center', 'medicine', 'exp_date'],
+                condition=models.Q(quantity__gt=0),
+                name='batch_fefo_idx',
+            ),
+            # Expiry risk: non-empty batches of every center by expiry date
+            models.Index(
+                fields=['exp_date'],
+                condition=models.Q(quantity__gt=0),
+                name='batch_expiry_idx',
+            ),
+        ]
     
     @property
     def is_expired(self):
-        return self.exp_date < date.today()
+        return self.exp_date is not None and self.exp_date < date.today()
 
     @property
     def is_depleted(self):
@@ -79,10 +113,15 @@ class Stock(models.Model):
     center = models.ForeignKey(MedicalCenter, on_delete=models.CASCADE)
     medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
     total_quantity = models.PositiveIntegerField(default=0)
-    last_updated = models.DateTimeField(auto_now=True)
+    # Bulk writers (F() updates, bulk_update) set this explicitly; /sync/ relies on it.
+    last_updated = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ['center', 'medicine']
+        indexes = [
+            # low-stock alerts filter and sort on the total
+            models.Index(fields=['total_quantity'], name='stock_total_quantity_idx'),
+        ]
 
 class MedicineReceipt(models.Model):
     center = models.ForeignKey(MedicalCenter, on_delete=models.CASCADE)
@@ -91,6 +130,12 @@ class MedicineReceipt(models.Model):
     exp_date = models.DateField(blank=True, null=True)
     received_date = models.DateField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            # newest-first listings and keyset pagination
+            models.Index(fields=['-received_date', 'id'], name='receipt_received_idx'),
+        ]
+
     @property
     def formatted_received_date(self):
         return self.received_date.strftime('%d/%m/%Y')
@@ -101,6 +146,8 @@ class MedicineReceipt(models.Model):
 
     def save(self, *args, **kwargs):
         with transaction.atomic():
+            # Serialize with every other stock write for this center/medicine
+            lock_stock(self.center, self.medicine)
             super().save(*args, **kwargs)
 
             # 1. Create a batch
@@ -113,13 +160,7 @@ class MedicineReceipt(models.Model):
             )
 
             # 2. Update total stock
-            total = MedicineBatch.objects.filter(
-                center=self.center, medicine=self.medicine
-            ).aggregate(total=models.Sum("quantity"))["total"] or 0
-
-            stock, _ = Stock.objects.get_or_create(center=self.center, medicine=self.medicine)
-            stock.total_quantity = total
-            stock.save()
+            apply_stock_delta(self.center, self.medicine, self.quantity_received)
 
 class WeeklyConsumptionReport(models.Model):
     week_start = models.DateField()
@@ -132,6 +173,12 @@ class WeeklyConsumptionReport(models.Model):
     class Meta:
         unique_together = ['week_start', 'week_end', 'medicine', 'center']
         ordering = ['-week_end']
+        indexes = [
+            # newest-first listings and keyset pagination, week_end range filters
+            models.Index(fields=['-week_end', 'id'], name='report_week_end_idx'),
+            # week_start range filters (dashboard windows, exports)
+            models.Index(fields=['week_start'], name='report_week_start_idx'),
+        ]
     
     @property
     def formatted_week_start(self):
@@ -144,48 +191,426 @@ class WeeklyConsumptionReport(models.Model):
     def save(self, *args, **kwargs):
         with transaction.atomic():
             is_new = self.pk is None
+            if is_new:
+                # Take the pair's stock lock before anything else, in the same order as
+                # every other stock write, so concurrent writers queue instead of deadlocking.
+                lock_stock(self.center, self.medicine)
+            previous = None if is_new else (
+                WeeklyConsumptionReport.objects
+                .filter(pk=self.pk)
+                .values_list('center_id', 'medicine_id', 'week_start', 'quantity_used')
+                .first()
+            )
             super().save(*args, **kwargs)
 
+            # Keep the consumption rollups in step with this report
+            deltas = {(self.center_id, self.medicine_id, self.week_start): self.quantity_used}
+            if previous:
+                key, quantity = previous[:3], previous[3]
+                deltas[key] = deltas.get(key, 0) - quantity
+            apply_rollup_deltas(deltas)
+
             if is_new:
                 # 1. Consume from batches
                 consume_medicine(self.center, self.medicine, self.quantity_used)
 
                 # 2. Update stock cache
-                total = MedicineBatch.objects.filter(
-                    center=self.center, medicine=self.medicine
-                ).aggregate(total=models.Sum("quantity"))["total"] or 0
-
-                stock, _ = Stock.objects.get_or_create(center=self.center, medicine=self.medicine)
-                stock.total_quantity = total
-                stock.save()
+                total = apply_stock_delta(self.center, self.medicine, -self.quantity_used)
 
                 # 3. Update observation
-                if total == 0:
-                    self.observation = "Rupture de stock"
-                elif total <= 10:
-                    self.observation = "Stock faible"
-                else:
-                    self.observation = "Stock suffisant"
+                self.observation = stock_observation(total)
 
                 super().save(update_fields=["observation"])
 
 
-def consume_medicine(center, medicine, quantity):
-    total_available = MedicineBatch.objects.filter(
-        center=center, medicine=medicine
-    ).aggregate(total=models.Sum("quantity"))["total"] or 0
-
-    if quantity > total_available:
-        raise ValueError(f"Not enough stock to consume {quantity} units of {medicine}")
-    batches = MedicineBatch.objects.filter(center=center, medicine=medicine).order_by("exp_date")
-    quantity_to_consume = quantity
+class ConsumptionRollup(models.Model):
+    """
+    Pre-aggregated consumption per center, medicine and period (ISO week or calendar month),
+    kept in step with WeeklyConsumptionReport so charts read a few rows instead of the fact table.
+    """
+    WEEK = 'week'
+    MONTH = 'month'
+    PERIOD_CHOICES = [
+        (WEEK, 'ISO week'),
+        (MONTH, 'Month'),
+    ]
+
+    center = models.ForeignKey(MedicalCenter, on_delete=models.CASCADE)
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    quantity_used = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['center', 'medicine', 'period', 'period_start']
+        indexes = [
+            models.Index(fields=['period', 'period_start'], name='rollup_period_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.center} - {self.medicine} - {self.period} {self.period_start}: {self.quantity_used}"
+
+
+class ImportJob(models.Model):
+    WEEKLY_REPORTS = 'weekly_reports'
+    RECEIPTS = 'receipts'
+    KIND_CHOICES = [
+        (WEEKLY_REPORTS, 'Weekly consumption reports'),
+        (RECEIPTS, 'Medicine receipts'),
+    ]
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    file_name = models.CharField(max_length=255)
+    file_content = models.BinaryField()
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_processed = models.PositiveIntegerField(default=0)
+    success_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    @property
+    def duration(self):
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
+
+    def __str__(self):
+        return f"{self.get_kind_display()} - {self.file_name} ({self.status})"
+
+
+class SyncTombstone(models.Model):
+    """A deleted center, medicine or stock row, kept so /sync/ can tell offline clients about it."""
+    CENTER = 'center'
+    MEDICINE = 'medicine'
+    STOCK = 'stock'
+    MODEL_CHOICES = [
+        (CENTER, 'Medical center'),
+        (MEDICINE, 'Medicine'),
+        (STOCK, 'Stock'),
+    ]
+
+    model = models.CharField(max_length=10, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['model', 'deleted_at'])]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted {self.deleted_at}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    An Idempotency-Key sent with a create request and the response it produced, so a retried
+    request gets the original response back instead of being applied twice.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['user', 'key']
+        indexes = [models.Index(fields=['created_at'])]
+
+    def __str__(self):
+        return f"{self.user} - {self.key} ({self.response_status})"
+
+
+class TableVersion(models.Model):
+    """
+    Version counter of a cached table (see cache.py), bumped after each committed write. It
+    lives in the database so every process, web workers and the import worker alike, reads
+    the same versions.
+    """
+    table = models.CharField(max_length=20, primary_key=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.table} v{self.version}"
+
+
+def annotate_batch_flags(queryset, today=None):
+    """
+    Add center/medicine names (joined) and the expired/depleted flags (computed in SQL) to a
+    MedicineBatch queryset. The flags are named apart from the is_expired/is_depleted
+    properties, which have no setter.
+    """
+    today = today or date.today()
+    return queryset.annotate(
+        center_name=models.F('center__name'),
+        medicine_name=models.F('medicine__name'),
+        unit=models.F('medicine__unit'),
+        expired_flag=models.Case(
+            models.When(exp_date__lt=today, then=models.Value(True)),
+            default=models.Value(False),
+            output_field=models.BooleanField(),
+        ),
+        depleted_flag=models.Case(
+            models.When(quantity=0, then=models.Value(True)),
+            default=models.Value(False),
+            output_field=models.BooleanField(),
+        ),
+    )
+
+
+def stock_observation(total):
+    if total == 0:
+        return "Rupture de stock"
+    elif total <= 10:
+        return "Stock faible"
+    return "Stock suffisant"
+
+
+BatchAllocation = namedtuple(
+    "BatchAllocation", ["batch_id", "batch_code", "exp_date", "quantity_drawn", "quantity_left"]
+)
+
+
+def allocate_fefo(batches, quantity):
+    """
+    Draw `quantity` units from `batches` (already ordered first-expiry-first-out).
+    Mutates the batch quantities in memory and returns (touched_batches, allocations).
+    """
+    remaining = quantity
+    touched = []
+    allocations = []
     for batch in batches:
-        if batch.quantity >= quantity_to_consume:
-            batch.quantity -= quantity_to_consume
-            batch.save()
+        if remaining == 0:
             break
-        else:
-            quantity_to_consume -= batch.quantity
-            batch.quantity = 0
-            batch.save()
+        drawn = min(batch.quantity, remaining)
+        if drawn == 0:
             continue
+        batch.quantity -= drawn
+        remaining -= drawn
+        touched.append(batch)
+        allocations.append(BatchAllocation(
+            batch_id=batch.id,
+            batch_code=batch.batch_code,
+            exp_date=batch.exp_date,
+            quantity_drawn=drawn,
+            quantity_left=batch.quantity,
+        ))
+    return touched, allocations
+
+
+def lock_stocks(pairs):
+    """
+    Lock the Stock rows of (center_id, medicine_id) `pairs`, in pair order, and return them
+    keyed by pair. Missing rows are created from their batch totals, so callers must lock
+    before writing batches. Every stock mutation takes this lock first: writes to one pair
+    are serialized, and a fixed lock order keeps concurrent multi-pair writers deadlock-free.
+    """
+    pairs = sorted(set(pairs))
+    with transaction.atomic():
+        stocks = {
+            (stock.center_id, stock.medicine_id): stock
+            for stock in Stock.objects
+            .select_for_update()
+            .filter(
+                center_id__in={center_id for center_id, _ in pairs},
+                medicine_id__in={medicine_id for _, medicine_id in pairs},
+            )
+            .order_by("center_id", "medicine_id")
+        }
+        missing = [pair for pair in pairs if pair not in stocks]
+        if missing:
+            totals = {
+                (row["center_id"], row["medicine_id"]): row["total"]
+                for row in MedicineBatch.objects
+                .filter(
+                    center_id__in={center_id for center_id, _ in missing},
+                    medicine_id__in={medicine_id for _, medicine_id in missing},
+                )
+                .values("center_id", "medicine_id")
+                .annotate(total=models.Sum("quantity"))
+                .order_by()
+            }
+            for center_id, medicine_id in missing:
+                try:
+                    with transaction.atomic():
+                        stock = Stock.objects.create(
+                            center_id=center_id,
+                            medicine_id=medicine_id,
+                            total_quantity=totals.get((center_id, medicine_id)) or 0,
+                        )
+                except IntegrityError:
+                    # Created concurrently: wait for that writer and lock its row.
+                    stock = Stock.objects.select_for_update().get(center_id=center_id, medicine_id=medicine_id)
+                stocks[(center_id, medicine_id)] = stock
+    return {pair: stocks[pair] for pair in pairs}
+
+
+def lock_stock(center, medicine):
+    """lock_stocks() for a single center/medicine; accepts instances or ids."""
+    pair = (getattr(center, "pk", center), getattr(medicine, "pk", medicine))
+    return lock_stocks([pair])[pair]
+
+
+def lock_batches(center, medicine):
+    """Lock and return the non-empty batches of a center/medicine in FEFO order (undated last)."""
+    return list(
+        MedicineBatch.objects
+        .select_for_update()
+        .filter(center=center, medicine=medicine, quantity__gt=0)
+        .order_by(models.F("exp_date").asc(nulls_last=True), "id")
+        .only("id", "quantity", "exp_date", "batch_code")
+    )
+
+
+def consume_medicine(center, medicine, quantity):
+    """
+    Consume `quantity` units of `medicine` at `center`, earliest expiry first.
+    Candidate batches are locked once, the allocation is computed in memory and
+    written back with a single bulk_update. Returns one BatchAllocation per batch drawn.
+    """
+    with transaction.atomic():
+        lock_stock(center, medicine)
+        batches = lock_batches(center, medicine)
+
+        total_available = sum(batch.quantity for batch in batches)
+        if quantity > total_available:
+            raise ValueError(f"Not enough stock to consume {quantity} units of {medicine}")
+
+        touched, allocations = allocate_fefo(batches, quantity)
+        if touched:
+            MedicineBatch.objects.bulk_update(touched, ["quantity"])
+        return allocations
+
+
+def apply_stock_delta(center, medicine, delta):
+    """
+    Add `delta` to the cached Stock total with an atomic F() update and return the new total.
+    The row is created on first use from the batch totals, so the hot path never re-aggregates history.
+    """
+    stock = Stock.objects.filter(center=center, medicine=medicine)
+    with transaction.atomic():
+        updated = stock.update(
+            total_quantity=models.F("total_quantity") + delta,
+            last_updated=timezone.now(),
+        )
+        if not updated:
+            total = MedicineBatch.objects.filter(
+                center=center, medicine=medicine
+            ).aggregate(total=models.Sum("quantity"))["total"] or 0
+            try:
+                with transaction.atomic():
+                    Stock.objects.create(center=center, medicine=medicine, total_quantity=total)
+            except IntegrityError:
+                # Created concurrently: fall back to the delta update.
+                stock.update(
+                    total_quantity=models.F("total_quantity") + delta,
+                    last_updated=timezone.now(),
+                )
+        bump_versions(STOCK)
+        return stock.values_list("total_quantity", flat=True).get()
+
+
+def apply_stock_deltas(deltas):
+    """
+    Grouped form of apply_stock_delta for bulk writes: `deltas` maps (center_id, medicine_id)
+    to a quantity change. Existing rows are locked and updated with one bulk_update; missing
+    rows are created from their batch totals with one grouped query and one bulk_create.
+    """
+    if not deltas:
+        return
+    center_ids = {center_id for center_id, _ in deltas}
+    medicine_ids = {medicine_id for _, medicine_id in deltas}
+    now = timezone.now()
+
+    with transaction.atomic():
+        stocks = {
+            (stock.center_id, stock.medicine_id): stock
+            for stock in Stock.objects.select_for_update().filter(
+                center_id__in=center_ids, medicine_id__in=medicine_ids
+            ).order_by("center_id", "medicine_id")
+        }
+        to_update = []
+        missing = set()
+        for key, delta in deltas.items():
+            stock = stocks.get(key)
+            if stock is None:
+                missing.add(key)
+                continue
+            stock.total_quantity += delta
+            stock.last_updated = now
+            to_update.append(stock)
+        Stock.objects.bulk_update(to_update, ["total_quantity", "last_updated"])
+        bump_versions(STOCK)
+
+        if missing:
+            totals = {
+                (row["center_id"], row["medicine_id"]): row["total"]
+                for row in MedicineBatch.objects
+                .filter(center_id__in=center_ids, medicine_id__in=medicine_ids)
+                .values("center_id", "medicine_id")
+                .annotate(total=models.Sum("quantity"))
+                .order_by()
+            }
+            Stock.objects.bulk_create([
+                Stock(center_id=center_id, medicine_id=medicine_id, total_quantity=totals.get((center_id, medicine_id)) or 0)
+                for center_id, medicine_id in missing
+            ])
+
+
+def rollup_periods(week_start):
+    """The (period, period_start) rollup rows a report starting on `week_start` counts towards."""
+    return [
+        (ConsumptionRollup.WEEK, week_start - timedelta(days=week_start.weekday())),
+        (ConsumptionRollup.MONTH, week_start.replace(day=1)),
+    ]
+
+
+def apply_rollup_deltas(deltas):
+    """
+    Add consumption deltas, keyed by (center_id, medicine_id, week_start), to the weekly and
+    monthly rollups. Increments go through a single INSERT ... ON CONFLICT DO UPDATE, which
+    creates missing rows and never loses a concurrent update; decrements (edited or deleted
+    reports) are plain F() updates of rows that already exist.
+    """
+    rows = {}
+    for (center_id, medicine_id, week_start), quantity in deltas.items():
+        for period, period_start in rollup_periods(week_start):
+            key = (center_id, medicine_id, period, period_start)
+            rows[key] = rows.get(key, 0) + quantity
+
+    increments = [(*key, quantity) for key, quantity in rows.items() if quantity > 0]
+    if increments:
+        table = connection.ops.quote_name(ConsumptionRollup._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} (center_id, medicine_id, period, period_start, quantity_used)"
+                f" VALUES (%s, %s, %s, %s, %s)"
+                f" ON CONFLICT (center_id, medicine_id, period, period_start)"
+                f" DO UPDATE SET quantity_used = {table}.quantity_used + excluded.quantity_used",
+                increments,
+            )
+
+    for (center_id, medicine_id, period, period_start), quantity in rows.items():
+        if quantity < 0:
+            ConsumptionRollup.objects.filter(
+                center_id=center_id, medicine_id=medicine_id, period=period, period_start=period_start,
+            ).update(quantity_used=Greatest(models.F('quantity_used') + quantity, 0))
@@ -0,0 +1,147 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class StandardPagination(PageNumberPagination):
+    """Page-number pagination whose size clients may pick with ?page_size=, up to MAX_PAGE_SIZE."""
+    page_size_query_param = 'page_size'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination over a composite ordering such as ('-received_date', '-id').
+
+    The cursor holds the ordering values of the last row sent, and the next page is fetched
+    with `WHERE (a, b) < (last_a, last_b)` expanded into ORs, so every page costs the same
+    index range scan however deep it is: no COUNT(*), no OFFSET. The last ordering field
+    must be unique and none may be nullable: order on a Coalesce() annotation instead of a
+    nullable column. Views can set `keyset_ordering` to override `ordering`.
+    """
+    ordering = ('-id',)
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    page_size_query_param = 'page_size'
+    max_page_size = settings.MAX_PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = tuple(getattr(view, 'keyset_ordering', self.ordering))
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+        self.annotations = queryset.query.annotations
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def _fields(self):
+        return [(field.lstrip('-'), field.startswith('-')) for field in self.ordering]
+
+    def keyset_filter(self, position):
+        clauses = []
+        for i, (name, descending) in enumerate(self._fields()):
+            equal = {field: position[field] for field, _ in self._fields()[:i]}
+            lookup = f"{name}__lt" if descending else f"{name}__gt"
+            clauses.append(Q(**equal, **{lookup: position[name]}))
+        return reduce(or_, clauses)
+
+    def encode_cursor(self, item):
+        values = {}
+        for name, _ in self._fields():
+            value = item[name] if isinstance(item, dict) else getattr(item, name)
+            values[name] = value.isoformat() if hasattr(value, 'isoformat') else value
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def field(self, name):
+        if name in self.annotations:
+            return self.annotations[name].output_field
+        return self.model._meta.get_field(name)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            return {name: self.field(name).to_python(values[name]) for name, _ in self._fields()}
+        except (KeyError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class SelectablePagination(BasePagination):
+    """
+    Page-number pagination by default, so existing clients keep working; keyset pagination
+    when the request asks for it with ?pagination=cursor (or follows a `next` cursor link).
+    """
+    mode_query_param = 'pagination'
+
+    def __init__(self):
+        self.page_number = StandardPagination()
+        self.keyset = KeysetPagination()
+        self.active = self.page_number
+
+    def uses_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.keyset.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.active = self.keyset if self.uses_keyset(request) else self.page_number
+        return self.active.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.active.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number.get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return self.page_number.get_schema_operation_parameters(view)
@@ -0,0 +1,58 @@
+import codecs
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib json paths below are used instead
+    orjson = None
+
+
+def orjson_available():
+    return orjson is not None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer producing the same bytes with orjson when it is installed.
+
+    orjson is told to hand dates, datetimes and anything it does not know (Decimal, lazy
+    strings, querysets...) to DRF's encoder, so formats stay exactly those of JSONRenderer.
+    Indented output (an `indent=` media type parameter, the browsable API) and the stdlib fallback go
+    through JSONRenderer itself, and so does data orjson cannot encode, such as integers
+    wider than 64 bits. Unlike STRICT_JSON, NaN and infinities render as null.
+    """
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or not self.compact or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same strict-javascript-subset escaping as JSONRenderer.
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser reading UTF-8 bodies with orjson when it is installed; NaN and infinities are rejected."""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
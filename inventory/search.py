@@ -0,0 +1,79 @@
+import math
+import re
+
+import numpy as np
+from django.conf import settings
+
+from .catalogue import cached_catalogue, fold, normalize_name
+
+WORD_RE = re.compile(r'\w+')
+
+
+def trigrams(text):
+    """
+    The trigrams of `text` once folded (see catalogue.fold), per word padded like pg_trgm:
+    'Amoxi 500' -> {'  a', ' am', 'amo', 'mox', 'oxi', 'xi ', '  5', ' 50', '500', '00 '}.
+    """
+    grams = set()
+    for word in WORD_RE.findall(fold(normalize_name(text))):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """
+    In-memory trigram index of a catalogue's names, built once per table version.
+
+    Each trigram maps to the array of names holding it, so a query only touches the names
+    sharing at least one of its trigrams: counting them is one numpy bincount. A name
+    scores the share of the query's trigrams it contains (pg_trgm's word similarity), so
+    prefixes and names with a typo or a missing accent rank high; ties go to the closest
+    whole name.
+    """
+    def __init__(self, rows):
+        self.ids, self.names, sizes = [], [], []
+        postings = {}
+        for position, (pk, name) in enumerate(rows):
+            grams = trigrams(name)
+            self.ids.append(pk)
+            self.names.append(name)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        self.sizes = np.array(sizes, dtype=np.int32)
+        self.postings = {gram: np.array(positions, dtype=np.int32) for gram, positions in postings.items()}
+
+    def search(self, query, limit=10, threshold=None):
+        """[(id, name, score)] of the best `limit` names scoring at least `threshold`, best first."""
+        threshold = settings.SEARCH_MIN_SIMILARITY if threshold is None else threshold
+        grams = trigrams(query)
+        hits = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not hits:
+            return []
+
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.ids))
+        candidates = np.flatnonzero(shared >= max(math.ceil(threshold * len(grams)), 1))
+        shared = shared[candidates]
+        score = shared / len(grams)
+        similarity = shared / (len(grams) + self.sizes[candidates] - shared)
+        best = np.lexsort((-similarity, -score))[:limit]
+        return [
+            (self.ids[candidates[i]], self.names[candidates[i]], round(float(score[i]), 3))
+            for i in best
+        ]
+
+
+def get_index(model):
+    return cached_catalogue(model, TrigramIndex)
+
+
+def search_names(model, query, limit=10):
+    """Names of `model` closest to `query`: [(id, name, score)], best first."""
+    return get_index(model).search(query, limit)
+
+
+def suggest(model, name):
+    """The existing name `name` was most likely meant to be, or None."""
+    matches = search_names(model, name, limit=1)
+    return matches[0][1] if matches else None
@@ -1,7 +1,9 @@
+from django.core.exceptions import ImproperlyConfigured
 from rest_framework import serializers
 from .models import (
     MedicalCenter, Medicine, Stock,
-    MedicineReceipt, WeeklyConsumptionReport, MedicineBatch
+    MedicineReceipt, WeeklyConsumptionReport, MedicineBatch,
+    ImportJob,
 )
 
 class MedicalCenterSerializer(serializers.ModelSerializer):
@@ -26,10 +28,13 @@ class StockSerializer(serializers.ModelSerializer):
         ]
 
 class MedicineBatchSerializer(serializers.ModelSerializer):
-    center_name = serializers.CharField(source='center.name', read_only=True)
-    medicine_name = serializers.CharField(source='medicine.name', read_only=True)
-    is_expired = serializers.BooleanField(read_only=True)
-    is_depleted = serializers.BooleanField(read_only=True)
+    # Names and flags are read from annotations (see annotate_batch_flags in models.py)
+    # so listing batches costs one query instead of per-row lookups and date checks.
+    center_name = serializers.CharField(read_only=True)
+    medicine_name = serializers.CharField(read_only=True)
+    unit = serializers.CharField(read_only=True)
+    is_expired = serializers.BooleanField(source='expired_flag', read_only=True)
+    is_depleted = serializers.BooleanField(source='depleted_flag', read_only=True)
     exp_date = serializers.DateField(format="%d/%m/%Y", required=False)
     received_date = serializers.DateField(format="%d/%m/%Y", required=False)
 
@@ -37,7 +42,7 @@ class MedicineBatchSerializer(serializers.ModelSerializer):
         model = MedicineBatch
         fields = [
             'id', 'center', 'center_name',
-            'medicine', 'medicine_name',
+            'medicine', 'medicine_name', 'unit',
             'quantity', 'exp_date', 'received_date',
             'batch_code', 'is_expired', 'is_depleted'
         ]
@@ -58,6 +63,15 @@ class MedicineReceiptSerializer(serializers.ModelSerializer):
         ]
 
 
+class MedicineReceiptBulkItemSerializer(serializers.Serializer):
+    """One item of POST /receipts/bulk/. Center and medicine ids are resolved for the whole list at once."""
+    center = serializers.IntegerField(min_value=1)
+    medicine = serializers.IntegerField(min_value=1)
+    quantity_received = serializers.IntegerField(min_value=0)
+    received_date = serializers.DateField(required=False)
+    exp_date = serializers.DateField(required=False, allow_null=True)
+
+
 class WeeklyConsumptionReportSerializer(serializers.ModelSerializer):
     center_name = serializers.CharField(source='center.name', read_only=True)
     medicine_name = serializers.CharField(source='medicine.name', read_only=True)
@@ -82,3 +96,70 @@ class WeeklyReportExcelUploadSerializer(serializers.Serializer):
         if not file.name.endswith('.xlsx'):
             raise serializers.ValidationError("Only .xlsx files are accepted.")
         return file
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    duration = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'kind', 'status', 'file_name',
+            'rows_total', 'rows_processed', 'success_count',
+            'errors', 'message',
+            'created_at', 'started_at', 'finished_at', 'duration'
+        ]
+        read_only_fields = fields
+
+
+class WeeklyReportBulkItemSerializer(serializers.Serializer):
+    """One item of POST /weekly/reports/bulk/. Center and medicine ids are resolved for the whole list at once."""
+    center = serializers.IntegerField(min_value=1)
+    medicine = serializers.IntegerField(min_value=1)
+    week_start = serializers.DateField()
+    week_end = serializers.DateField()
+    quantity_used = serializers.IntegerField(min_value=0)
+
+    def validate(self, data):
+        if data['week_end'] < data['week_start']:
+            raise serializers.ValidationError("week_end must not be before week_start")
+        return data
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path producing the same list output as a ModelSerializer from values()
+    dicts instead of model instances: no instance construction, no attribute traversal for
+    `source='center.name'` (the name comes from the same join), and only date/time fields
+    go through their field's to_representation. Supports plain, dotted-source and
+    primary-key related fields, which is all the list serializers here use.
+    """
+    CONVERTED_FIELDS = (serializers.DateField, serializers.DateTimeField, serializers.DecimalField)
+
+    def __init__(self, serializer_class):
+        self.columns = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or isinstance(field, (serializers.SerializerMethodField, serializers.ListSerializer)):
+                raise ImproperlyConfigured(f"{serializer_class.__name__}.{name} cannot be read from values()")
+            converter = field.to_representation if isinstance(field, self.CONVERTED_FIELDS) else None
+            self.columns.append((name, field.source.replace('.', '__'), converter))
+
+    @property
+    def lookups(self):
+        return [lookup for _, lookup, _ in self.columns]
+
+    def values(self, queryset, *extra):
+        """`queryset` as values() dicts with every column, plus `extra` lookups (e.g. keyset fields)."""
+        lookups = self.lookups
+        return queryset.values(*lookups, *(lookup for lookup in extra if lookup not in lookups))
+
+    def to_representation(self, rows):
+        return [
+            {
+                name: converter(row[lookup]) if converter else row[lookup]
+                for name, lookup, converter in self.columns
+            }
+            for row in rows
+        ]
@@ -1,9 +1,56 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .cache import CENTERS, MEDICINES, STOCK, RECEIPTS, REPORTS, bump_versions
+from .catalogue import CATALOGUE_TABLES, invalidate as invalidate_catalogue
+from .models import (
+    UserProfile, MedicalCenter, Medicine, MedicineBatch, Stock, MedicineReceipt,
+    WeeklyConsumptionReport, SyncTombstone, apply_rollup_deltas,
+)
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
+
+CACHED_TABLES = {
+    MedicalCenter: CENTERS,
+    Medicine: MEDICINES,
+    Stock: STOCK,
+    # Batches are the breakdown of stock; bulk batch writes bump STOCK alongside the totals.
+    MedicineBatch: STOCK,
+    MedicineReceipt: RECEIPTS,
+    WeeklyConsumptionReport: REPORTS,
+}
+
+def invalidate_inventory_cache(sender, **kwargs):
+    bump_versions(CACHED_TABLES[sender])
+
+for model in CACHED_TABLES:
+    post_save.connect(invalidate_inventory_cache, sender=model)
+    post_delete.connect(invalidate_inventory_cache, sender=model)
+
+# The version bump above only lands on commit; until then this process must not keep
+# serving the names it had loaded.
+def drop_catalogue(sender, **kwargs):
+    invalidate_catalogue(sender)
+
+for model in CATALOGUE_TABLES:
+    post_save.connect(drop_catalogue, sender=model)
+    post_delete.connect(drop_catalogue, sender=model)
+
+@receiver(post_delete, sender=WeeklyConsumptionReport)
+def remove_report_from_rollups(sender, instance, **kwargs):
+    apply_rollup_deltas({(instance.center_id, instance.medicine_id, instance.week_start): -instance.quantity_used})
+
+SYNCED_MODELS = {
+    MedicalCenter: SyncTombstone.CENTER,
+    Medicine: SyncTombstone.MEDICINE,
+    Stock: SyncTombstone.STOCK,
+}
+
+def record_sync_tombstone(sender, instance, **kwargs):
+    SyncTombstone.objects.create(model=SYNCED_MODELS[sender], object_id=instance.pk)
+
+for model in SYNCED_MODELS:
+    post_delete.connect(record_sync_tombstone, sender=model)
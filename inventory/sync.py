@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import MedicalCenter, Medicine, Stock, SyncTombstone
+
+# Tables in the feed: response key -> (tombstone model, queryset of rows, change timestamp field)
+SYNC_TABLES = {
+    'centers': (
+        SyncTombstone.CENTER,
+        lambda: MedicalCenter.objects.values('id', 'name'),
+        'updated_at',
+    ),
+    'medicines': (
+        SyncTombstone.MEDICINE,
+        lambda: Medicine.objects.values('id', 'name', 'unit'),
+        'updated_at',
+    ),
+    'stocks': (
+        SyncTombstone.STOCK,
+        lambda: Stock.objects.values(
+            'id', 'center', 'medicine', 'total_quantity', 'last_updated',
+            center_name=F('center__name'), medicine_name=F('medicine__name'),
+        ),
+        'last_updated',
+    ),
+}
+
+
+def encode_token(moment):
+    """Sync tokens are the server time of the sync in integer microseconds since the epoch."""
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def decode_token(token):
+    """Raises ValueError on anything that is not a token this server could have issued."""
+    micros = int(token)
+    if micros < 0:
+        raise ValueError(token)
+    return datetime.fromtimestamp(0, dt_timezone.utc) + timedelta(microseconds=micros)
+
+
+def sync_changes(since=None):
+    """
+    Rows of the synced tables created or updated since `since`, plus the ids deleted since
+    then, and the token for the next call. Without `since`, or when `since` is older than the
+    tombstones still kept, every row is returned and `full` is set: the client must replace
+    its copy instead of merging.
+
+    Timestamps are taken when a row is written, not when its transaction commits, so a
+    writer that commits after a sync could land just before that sync's token. Each call
+    therefore looks SYNC_OVERLAP_SECONDS further back than the token; clients upsert by id,
+    so rows seen twice are harmless.
+    """
+    now = timezone.now()
+    retention = now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+    full = since is None or since < retention
+    after = None if full else since - timedelta(seconds=settings.SYNC_OVERLAP_SECONDS)
+
+    changes = {"token": encode_token(now), "full": full}
+    for key, (tombstone_model, rows, changed_field) in SYNC_TABLES.items():
+        queryset = rows()
+        if after is None:
+            changes[key] = {"updated": list(queryset.order_by('id')), "deleted": []}
+            continue
+        changes[key] = {
+            "updated": list(queryset.filter(**{f"{changed_field}__gte": after}).order_by('id')),
+            "deleted": list(
+                SyncTombstone.objects
+                .filter(model=tombstone_model, deleted_at__gte=after)
+                .order_by('object_id')
+                .values_list('object_id', flat=True)
+                .distinct()
+            ),
+        }
+    return changes
@@ -1,3 +1,1126 @@
-from django.test import TestCase
+import csv
+import random
+import threading
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.db.models import F, Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .analytics import services as analytics
+from .analytics.services import week_monday
+from .cache import MEDICINES
+from .catalogue import _catalogues, _ids_by_key, resolve_names
+from .exports import WEEKLY_REPORT_HEADERS, parquet_available
+from .importers import RECEIPT_COLUMNS, WEEKLY_REPORT_COLUMNS, import_medicine_receipts, import_weekly_reports
+from .jobs import claim_next_job, run_import_job
+from .middleware import CompressionMiddleware, brotli_available
+from .renderers import FastJSONParser, FastJSONRenderer, orjson_available
+from .models import (
+    ConsumptionRollup, IdempotencyKey, ImportJob, MedicalCenter, Medicine, MedicineBatch, MedicineReceipt, Stock, TableVersion,
+    WeeklyConsumptionReport, consume_medicine,
+)
+from .serializers import (
+    MedicalCenterSerializer, MedicineReceiptSerializer, MedicineSerializer, StockSerializer,
+    WeeklyConsumptionReportSerializer,
+)
+
+
+@skipUnless(connection.vendor == 'postgresql', "index plans are PostgreSQL-specific")
+class HotPathIndexTests(TestCase):
+    """The planner must be able to answer each hot query shape from its dedicated index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.center = MedicalCenter.objects.create(name="Centre de santé Kigali")
+        cls.medicine = Medicine.objects.create(name="Paracétamol 500mg", unit="cp")
+        today = date.today()
+        MedicineBatch.objects.bulk_create([
+            MedicineBatch(
+                center=cls.center, medicine=cls.medicine, quantity=i % 3,
+                exp_date=today + timedelta(days=i), batch_code=f"B-{i}",
+            )
+            for i in range(200)
+        ])
+        Stock.objects.create(center=cls.center, medicine=cls.medicine, total_quantity=5)
+        MedicineReceipt.objects.bulk_create([
+            MedicineReceipt(
+                center=cls.center, medicine=cls.medicine, quantity_received=1,
+                received_date=today - timedelta(days=i),
+            )
+            for i in range(200)
+        ])
+        WeeklyConsumptionReport.objects.bulk_create([
+            WeeklyConsumptionReport(
+                center=cls.center, medicine=cls.medicine, quantity_used=1,
+                week_start=today - timedelta(weeks=i, days=6), week_end=today - timedelta(weeks=i),
+            )
+            for i in range(200)
+        ])
+
+    def assertUsesIndex(self, queryset, index_name):
+        # Tables this small are cheaper to scan, so take sequential scans off the table:
+        # what matters is that the index is usable for the query shape.
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_fefo_batches(self):
+        self.assertUsesIndex(
+            MedicineBatch.objects
+            .filter(center=self.center, medicine=self.medicine, quantity__gt=0)
+            .order_by('exp_date'),
+            'batch_fefo_idx',
+        )
+
+    def test_expiring_batches(self):
+        self.assertUsesIndex(
+            MedicineBatch.objects.filter(quantity__gt=0, exp_date__lte=date.today() + timedelta(days=30)),
+            'batch_expiry_idx',
+        )
+
+    def test_low_stock(self):
+        self.assertUsesIndex(Stock.objects.filter(total_quantity__lte=10), 'stock_total_quantity_idx')
+
+    def test_receipts_newest_first(self):
+        self.assertUsesIndex(MedicineReceipt.objects.order_by('-received_date', 'id')[:15], 'receipt_received_idx')
+
+    def test_reports_newest_first(self):
+        self.assertUsesIndex(WeeklyConsumptionReport.objects.order_by('-week_end', 'id')[:15], 'report_week_end_idx')
+
+    def test_reports_week_start_range(self):
+        self.assertUsesIndex(
+            WeeklyConsumptionReport.objects.filter(week_start__gte=date.today() - timedelta(weeks=4)),
+            'report_week_start_idx',
+        )
+
+    def test_name_iexact(self):
+        self.assertUsesIndex(Medicine.objects.filter(name__iexact="paracétamol 500mg"), 'medicine_upper_name_idx')
+        self.assertUsesIndex(MedicalCenter.objects.filter(name__iexact="centre de santé kigali"), 'center_upper_name_idx')
+
+
+class IdempotencyKeyTests(TestCase):
+    """Create requests carrying an Idempotency-Key are applied once and replayed after."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('nurse', password='x'))
+        self.center = MedicalCenter.objects.create(name="Centre A")
+        self.medicine = Medicine.objects.create(name="Amoxicilline", unit="gél")
+        MedicineReceipt.objects.create(center=self.center, medicine=self.medicine, quantity_received=50)
+        self.payload = {
+            'center': self.center.id, 'medicine': self.medicine.id, 'quantity_used': 10,
+            'week_start': '2026-01-05', 'week_end': '2026-01-11',
+        }
+
+    def post(self, payload, key):
+        return self.client.post('/api/weekly/reports/', payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_first_response(self):
+        first = self.post(self.payload, 'sync-1')
+        retry = self.post(self.payload, 'sync-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(WeeklyConsumptionReport.objects.count(), 1)
+        self.assertEqual(Stock.objects.get().total_quantity, 40)
+
+    def test_key_reused_for_other_request(self):
+        self.post(self.payload, 'sync-1')
+        response = self.post({**self.payload, 'quantity_used': 5}, 'sync-1')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(WeeklyConsumptionReport.objects.count(), 1)
+
+    def test_failed_request_releases_key(self):
+        response = self.post({**self.payload, 'center': 0}, 'sync-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.assertEqual(self.post(self.payload, 'sync-1').status_code, 201)
+
+
+class BulkCreateTests(TestCase):
+    """POST /receipts/bulk/ is all or nothing; POST /weekly/reports/bulk/ reports each item."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('nurse', password='x'))
+        self.center = MedicalCenter.objects.create(name="Centre A")
+        self.medicine = Medicine.objects.create(name="Amoxicilline", unit="gél")
+
+    def post(self, url, items, **headers):
+        return self.client.post(url, items, format='json', **headers)
+
+    def receipt(self, **fields):
+        return {'center': self.center.id, 'medicine': self.medicine.id, 'quantity_received': 10, **fields}
+
+    def report(self, week_start, **fields):
+        week_end = date.fromisoformat(week_start) + timedelta(days=6)
+        return {
+            'center': self.center.id, 'medicine': self.medicine.id, 'quantity_used': 5,
+            'week_start': week_start, 'week_end': week_end.isoformat(), **fields,
+        }
+
+    def test_receipts_all_or_nothing(self):
+        response = self.post('/api/receipts/bulk/', [self.receipt(), self.receipt(quantity_received=-1)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((response.data['created'], response.data['failed']), (0, 1))
+        self.assertEqual(response.data['results'][0]['index'], 1)
+        self.assertFalse(MedicineReceipt.objects.exists())
+
+        response = self.post('/api/receipts/bulk/', [self.receipt(), self.receipt(exp_date='2027-01-31')])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(MedicineBatch.objects.count(), 2)
+        self.assertEqual(Stock.objects.get().total_quantity, 20)
+
+    def test_reports_mixed_results(self):
+        MedicineReceipt.objects.create(center=self.center, medicine=self.medicine, quantity_received=8)
+        response = self.post('/api/weekly/reports/bulk/', [
+            self.report('2026-01-05'),
+            self.report('2026-01-05'),
+            self.report('2026-01-12', quantity_used=50),
+            self.report('2026-01-19', week_end='2026-01-18'),
+        ])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']], ['created', 'error', 'error', 'error'],
+        )
+        self.assertIn("already exists", str(response.data['results'][1]['errors']))
+        self.assertIn("Not enough stock", str(response.data['results'][2]['errors']))
+        self.assertEqual(WeeklyConsumptionReport.objects.count(), 1)
+        self.assertEqual(Stock.objects.get().total_quantity, 3)
+
+    def test_unknown_ids(self):
+        response = self.post('/api/receipts/bulk/', [self.receipt(center=999999), self.receipt(medicine=999999)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data['results'][0]['errors']), ['center'])
+        self.assertEqual(list(response.data['results'][1]['errors']), ['medicine'])
+
+    @override_settings(BULK_MAX_ITEMS=2)
+    def test_too_many_items(self):
+        for items in ([], [self.receipt()] * 3, self.receipt()):
+            with self.subTest(items=items):
+                response = self.post('/api/receipts/bulk/', items)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("1 to 2", response.data['error'])
+        self.assertFalse(MedicineReceipt.objects.exists())
+
+    def test_idempotent_replay(self):
+        first = self.post('/api/receipts/bulk/', [self.receipt()], HTTP_IDEMPOTENCY_KEY='bulk-1')
+        retry = self.post('/api/receipts/bulk/', [self.receipt()], HTTP_IDEMPOTENCY_KEY='bulk-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(MedicineReceipt.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', "needs row locks across connections")
+class ConcurrentStockWriteTests(TransactionTestCase):
+    """Stock totals must match the batches after many concurrent receipts and consumptions."""
+
+    threads = 8
+    operations_per_thread = 250
+
+    def setUp(self):
+        self.centers = [MedicalCenter.objects.create(name=f"Centre {i}") for i in range(2)]
+        self.medicines = [Medicine.objects.create(name=f"Médicament {i}", unit="cp") for i in range(2)]
+
+    def run_threads(self, target):
+        errors = []
+
+        def worker(n):
+            try:
+                target(n)
+            except Exception as e:  # surfaced in the main thread
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(n,)) for n in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_batches_match_stock(self):
+        first_week = date(2020, 1, 6)
+
+        def operate(n):
+            rng = random.Random(n)
+            for i in range(self.operations_per_thread):
+                center, medicine = rng.choice(self.centers), rng.choice(self.medicines)
+                if rng.random() < 0.5:
+                    MedicineReceipt.objects.create(
+                        center=center, medicine=medicine, quantity_received=rng.randint(1, 20),
+                        exp_date=first_week + timedelta(days=rng.randint(0, 400)),
+                    )
+                    continue
+                # one report per thread and operation, so the unique week key never collides
+                week_start = first_week + timedelta(weeks=n * self.operations_per_thread + i)
+                try:
+                    WeeklyConsumptionReport.objects.create(
+                        center=center, medicine=medicine, quantity_used=rng.randint(1, 25),
+                        week_start=week_start, week_end=week_start + timedelta(days=6),
+                    )
+                except ValueError:
+                    pass  # not enough stock: rolled back, nothing consumed
+
+        self.run_threads(operate)
+
+        for center in self.centers:
+            for medicine in self.medicines:
+                pair = {'center': center, 'medicine': medicine}
+                received = MedicineReceipt.objects.filter(**pair).aggregate(total=Sum('quantity_received'))['total'] or 0
+                used = WeeklyConsumptionReport.objects.filter(**pair).aggregate(total=Sum('quantity_used'))['total'] or 0
+                in_batches = MedicineBatch.objects.filter(**pair).aggregate(total=Sum('quantity'))['total'] or 0
+                stock = Stock.objects.filter(**pair).values_list('total_quantity', flat=True).first() or 0
+                self.assertEqual(in_batches, received - used)
+                self.assertEqual(stock, in_batches)
+
+    def test_concurrent_retries_create_once(self):
+        user = User.objects.create_user('nurse', password='x')
+        MedicineReceipt.objects.create(center=self.centers[0], medicine=self.medicines[0], quantity_received=100)
+        payload = {
+            'center': self.centers[0].id, 'medicine': self.medicines[0].id, 'quantity_used': 10,
+            'week_start': '2026-01-05', 'week_end': '2026-01-11',
+        }
+        responses = []
+
+        def post(n):
+            client = APIClient()
+            client.force_authenticate(user)
+            responses.append(client.post('/api/weekly/reports/', payload, format='json', HTTP_IDEMPOTENCY_KEY='sync-1'))
+
+        self.run_threads(post)
+
+        self.assertEqual({response.status_code for response in responses}, {201})
+        self.assertEqual(len({response.data['id'] for response in responses}), 1)
+        self.assertEqual(WeeklyConsumptionReport.objects.count(), 1)
+        self.assertEqual(Stock.objects.get(center=self.centers[0], medicine=self.medicines[0]).total_quantity, 90)
+
+
+class ListQueryCountTests(TestCase):
+    """List endpoints cost a fixed number of queries, whatever the page size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('nurse', password='x')
+        cls.rows = {'/api/centers/': 5, '/api/stocks/': 60, '/api/receipts/': 60, '/api/weekly/reports/': 60}
+        centers = MedicalCenter.objects.bulk_create([MedicalCenter(name=f"Centre {i}") for i in range(5)])
+        medicines = Medicine.objects.bulk_create([Medicine(name=f"Médicament {i}", unit="cp") for i in range(12)])
+        today = date.today()
+        Stock.objects.bulk_create([
+            Stock(center=center, medicine=medicine, total_quantity=10) for center in centers for medicine in medicines
+        ])
+        MedicineReceipt.objects.bulk_create([
+            MedicineReceipt(
+                center=centers[i % 5], medicine=medicines[i % 12], quantity_received=i,
+                received_date=today - timedelta(days=i), exp_date=today + timedelta(days=i) if i % 2 else None,
+            )
+            for i in range(60)
+        ])
+        WeeklyConsumptionReport.objects.bulk_create([
+            WeeklyConsumptionReport(
+                center=centers[i % 5], medicine=medicines[i % 12], quantity_used=1, observation="RAS",
+                week_start=today - timedelta(weeks=i, days=6), week_end=today - timedelta(weeks=i),
+            )
+            for i in range(60)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertListQueries(self, url, queries, **params):
+        for page_size in (1, 50):
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, {**params, 'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), min(page_size, self.rows[url]))
+
+    # Every list also reads its tables' versions for the ETag (see conditional.py).
+    def test_page_number_lists(self):
+        for url in ('/api/stocks/', '/api/receipts/', '/api/weekly/reports/'):
+            with self.subTest(url=url):
+                self.assertListQueries(url, 3)  # versions + count + page
+
+    def test_keyset_lists(self):
+        for url in ('/api/stocks/', '/api/receipts/', '/api/weekly/reports/'):
+            with self.subTest(url=url):
+                self.assertListQueries(url, 2, pagination='cursor')  # versions + page, no count
+
+    def test_centers_and_medicines(self):
+        self.assertListQueries('/api/centers/', 3)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.client.get('/api/medicines/').data), 12)
+
+    def test_matches_model_serializer(self):
+        cases = [
+            ('/api/centers/', MedicalCenterSerializer, MedicalCenter.objects.order_by('id')),
+            ('/api/stocks/', StockSerializer, Stock.objects.order_by('id')),
+            ('/api/receipts/', MedicineReceiptSerializer, MedicineReceipt.objects.order_by('id')),
+            ('/api/weekly/reports/', WeeklyConsumptionReportSerializer, WeeklyConsumptionReport.objects.order_by('id')),
+        ]
+        for url, serializer_class, queryset in cases:
+            with self.subTest(url=url):
+                results = self.client.get(url, {'page_size': 100}).data['results']
+                expected = serializer_class(queryset, many=True).data
+                self.assertEqual(sorted(results, key=lambda row: row['id']), expected)
+        self.assertEqual(
+            sorted(self.client.get('/api/medicines/').data, key=lambda row: row['id']),
+            MedicineSerializer(Medicine.objects.order_by('id'), many=True).data,
+        )
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages walk the whole ordering once, ties on the leading field included."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('nurse', password='x'))
+        center = MedicalCenter.objects.create(name="Centre A")
+        medicine = Medicine.objects.create(name="Quinine", unit="cp")
+        for day in (3, 1, 3, 2, 1):
+            MedicineReceipt.objects.create(
+                center=center, medicine=medicine, quantity_received=1, received_date=date(2024, 1, day),
+            )
+
+    def walk(self, url, params):
+        ids = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertLessEqual(len(response.data['results']), params['page_size'])
+            ids += [row['id'] for row in response.data['results']]
+            if response.data['next'] is None:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_walk(self):
+        ids = self.walk('/api/receipts/', {'pagination': 'cursor', 'page_size': 2})
+        expected = MedicineReceipt.objects.order_by('-received_date', 'id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/receipts/', {'cursor': 'bm9wZQ=='}).status_code, 404)
+
+    def test_batches_earliest_expiry_first(self):
+        for batch, exp_date in zip(MedicineBatch.objects.order_by('id'), (None, date(2025, 3, 1), None, date(2025, 1, 1))):
+            batch.exp_date = exp_date
+            batch.save(update_fields=['exp_date'])
+        expected = list(
+            MedicineBatch.objects.order_by(F('exp_date').asc(nulls_last=True), 'id').values_list('id', flat=True)
+        )
+
+        self.assertEqual(self.walk('/api/batches/', {'pagination': 'cursor', 'page_size': 2}), expected)
+        self.assertEqual([row['id'] for row in self.client.get('/api/batches/').data['results']], expected)
+
+
+class FutureWeekAnalyticsTests(TestCase):
+    """A report dated in a week that has not started yet must not break the weekly analytics."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('nurse', password='x'))
+        center = MedicalCenter.objects.create(name="Centre A")
+        medicine = Medicine.objects.create(name="Amoxicilline", unit="gél")
+        MedicineReceipt.objects.create(
+            center=center, medicine=medicine, quantity_received=50, exp_date=date.today() + timedelta(days=10),
+        )
+        this_week = week_monday(date.today())
+        for week_start in (this_week, this_week + timedelta(weeks=1)):
+            WeeklyConsumptionReport.objects.create(
+                center=center, medicine=medicine, quantity_used=7,
+                week_start=week_start, week_end=week_start + timedelta(days=6),
+            )
+
+    def test_future_week_is_left_out(self):
+        velocity = analytics.get_consumption_velocity(weeks=2)
+        self.assertEqual(len(velocity), 1)
+        self.assertEqual(velocity[0]['average_weekly'], 3.5)
+
+    def test_endpoints(self):
+        for url in ('/api/analytics/velocity/', '/api/analytics/forecast/', '/api/dashboard/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class StockOutForecastTests(TestCase):
+    """Days of cover are the stock over the average daily consumption of the window."""
+
+    def setUp(self):
+        cache.clear()
+        self.today = week_monday(date.today()) + timedelta(days=2)
+        self.quinine = Medicine.objects.create(name="Quinine", unit="cp")
+        zinc = Medicine.objects.create(name="Zinc", unit="cp")
+        self.center_a, self.center_b = (MedicalCenter.objects.create(name=name) for name in ("Centre A", "Centre B"))
+        receipts = ((self.center_a, self.quinine, 100), (self.center_a, zinc, 10), (self.center_b, self.quinine, 30))
+        for center, medicine, quantity in receipts:
+            MedicineReceipt.objects.create(center=center, medicine=medicine, quantity_received=quantity)
+        # Centre A: 7 + 21 units over two weeks, 2 a day. Centre B: 14 in the last week only, 1 a day.
+        for center, weeks_ago, quantity_used in ((self.center_a, 1, 7), (self.center_a, 0, 21), (self.center_b, 0, 14)):
+            week_start = week_monday(self.today) - timedelta(weeks=weeks_ago)
+            WeeklyConsumptionReport.objects.create(
+                center=center, medicine=self.quinine, quantity_used=quantity_used,
+                week_start=week_start, week_end=week_start + timedelta(days=6),
+            )
+
+    def test_days_of_cover(self):
+        forecast = analytics.forecast_stock_out(weeks=2, today=self.today)
+        self.assertEqual(
+            [
+                (row['center_name'], row['medicine_name'], row['stock_quantity'], row['average_weekly'],
+                 row['days_of_cover'], row['stock_out_date'])
+                for row in forecast
+            ],
+            [
+                ("Centre B", "Quinine", 16, 7.0, 16.0, self.today + timedelta(days=16)),
+                ("Centre A", "Quinine", 72, 14.0, 36.0, self.today + timedelta(days=36)),
+                ("Centre A", "Zinc", 10, 0.0, None, None),
+            ],
+        )
+
+    def test_within(self):
+        forecast = analytics.forecast_stock_out(weeks=2, within=20, today=self.today)
+        self.assertEqual([(row['center_id'], row['medicine_id']) for row in forecast], [(self.center_b.id, self.quinine.id)])
+
+
+class ExpiryRiskTests(TestCase):
+    """Expired batches are lost in full; the others lose what the consumption rate cannot use in time."""
+
+    def setUp(self):
+        cache.clear()
+        self.today = week_monday(date.today()) + timedelta(days=2)
+        self.center = MedicalCenter.objects.create(name="Centre A")
+        medicine = Medicine.objects.create(name="Quinine", unit="cp")
+
+        def receive(quantity, days):
+            MedicineReceipt.objects.create(
+                center=self.center, medicine=medicine, quantity_received=quantity,
+                exp_date=self.today + timedelta(days=days),
+            )
+
+        for quantity, days in ((20, 10), (20, 20), (50, 60)):
+            receive(quantity, days)
+        # 14 units over the two-week window, 1 a day, drawn from the batch expiring in 10 days.
+        week_start = week_monday(self.today)
+        WeeklyConsumptionReport.objects.create(
+            center=self.center, medicine=medicine, quantity_used=14,
+            week_start=week_start, week_end=week_start + timedelta(days=6),
+        )
+        receive(10, -1)
+
+    def test_batches(self):
+        # 6 left of the first batch are used within its 10 days; of the next 20, only 20 - 6
+        # can be used in 20 days, so 6 expire unused. The batch expiring in 60 days is beyond
+        # the horizon.
+        batches = analytics.get_expiry_risk(days=30, weeks=2, today=self.today)[0]['batches']
+        self.assertEqual(
+            [(batch['days_left'], batch['quantity'], batch['projected_unused']) for batch in batches],
+            [(-1, 10, 10), (10, 6, 0), (20, 20, 6)],
+        )
+
+    def test_summary(self):
+        self.assertEqual(analytics.get_expiry_risk_summary(days=30, weeks=2, today=self.today), [{
+            "center_id": self.center.id,
+            "center_name": "Centre A",
+            "batches_at_risk": 3,
+            "quantity_at_risk": 36,
+            "projected_unused": 16,
+        }])
+        self.assertEqual(analytics.get_expiry_risk_summary(days=5, weeks=2, today=self.today)[0]['projected_unused'], 10)
+
+
+class FefoConsumptionTests(TestCase):
+    """Consumption draws the batch expiring first, undated batches last."""
+
+    def setUp(self):
+        self.center = MedicalCenter.objects.create(name="Centre A")
+        self.medicine = Medicine.objects.create(name="Quinine", unit="cp")
+        today = date.today()
+        for exp_date in (today + timedelta(days=60), None, today + timedelta(days=10)):
+            MedicineReceipt.objects.create(
+                center=self.center, medicine=self.medicine, quantity_received=10, exp_date=exp_date,
+            )
+        self.late, self.undated, self.early = MedicineBatch.objects.order_by('id')
+
+    def quantities(self):
+        return [batch.quantity for batch in MedicineBatch.objects.order_by('id')]
+
+    def test_earliest_expiry_first(self):
+        allocations = consume_medicine(self.center, self.medicine, 15)
+        self.assertEqual(
+            [(a.batch_id, a.quantity_drawn, a.quantity_left) for a in allocations],
+            [(self.early.id, 10, 0), (self.late.id, 5, 5)],
+        )
+        consume_medicine(self.center, self.medicine, 10)
+        self.assertEqual(self.quantities(), [0, 5, 0])
+
+    def test_not_enough_stock(self):
+        with self.assertRaises(ValueError):
+            consume_medicine(self.center, self.medicine, 31)
+        self.assertEqual(self.quantities(), [10, 10, 10])
+
+
+class ConsumptionRollupTests(TestCase):
+    """Weekly and monthly rollups follow reports as they are created, edited and deleted."""
+
+    def setUp(self):
+        self.center, self.other_center = (MedicalCenter.objects.create(name=name) for name in ("Centre A", "Centre B"))
+        self.medicine, self.other_medicine = (
+            Medicine.objects.create(name=name, unit="cp") for name in ("Quinine", "Artéméther")
+        )
+        MedicineReceipt.objects.create(center=self.center, medicine=self.medicine, quantity_received=100)
+
+    def report(self, week_start, quantity_used):
+        return WeeklyConsumptionReport.objects.create(
+            center=self.center, medicine=self.medicine, quantity_used=quantity_used,
+            week_start=week_start, week_end=week_start + timedelta(days=6),
+        )
+
+    def rollups(self):
+        return {
+            (row.center_id, row.medicine_id, row.period, row.period_start): row.quantity_used
+            for row in ConsumptionRollup.objects.filter(quantity_used__gt=0)
+        }
+
+    def expected(self, center, medicine, week_start, quantity, month_quantity=None):
+        return {
+            (center.id, medicine.id, ConsumptionRollup.WEEK, week_start): quantity,
+            (center.id, medicine.id, ConsumptionRollup.MONTH, week_start.replace(day=1)): month_quantity or quantity,
+        }
+
+    def test_create(self):
+        self.report(date(2024, 1, 22), 5)
+        self.report(date(2024, 1, 29), 7)
+        self.assertEqual(self.rollups(), {
+            **self.expected(self.center, self.medicine, date(2024, 1, 22), 5, month_quantity=12),
+            **self.expected(self.center, self.medicine, date(2024, 1, 29), 7, month_quantity=12),
+        })
+
+    def test_edit_across_weeks(self):
+        report = self.report(date(2024, 1, 29), 7)
+        report.week_start, report.week_end = date(2024, 2, 5), date(2024, 2, 11)
+        report.quantity_used = 9
+        report.save()
+        self.assertEqual(self.rollups(), self.expected(self.center, self.medicine, date(2024, 2, 5), 9))
+
+    def test_edit_center_and_medicine(self):
+        report = self.report(date(2024, 1, 29), 7)
+        report.center, report.medicine = self.other_center, self.other_medicine
+        report.save()
+        self.assertEqual(self.rollups(), self.expected(self.other_center, self.other_medicine, date(2024, 1, 29), 7))
+
+    def test_delete(self):
+        kept = self.report(date(2024, 1, 22), 5)
+        self.report(date(2024, 1, 29), 7).delete()
+        self.assertEqual(self.rollups(), self.expected(self.center, self.medicine, kept.week_start, 5))
+
+        WeeklyConsumptionReport.objects.all().delete()
+        self.assertEqual(self.rollups(), {})
+
+
+class MaintenanceCommandTests(TestCase):
+    """Repair commands write in bulk, so they must bump the versions cached reads are keyed on."""
+
+    def setUp(self):
+        # Versions roll back with each test, so another test's dashboard may sit under the same key.
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('nurse', password='x'))
+        self.center = MedicalCenter.objects.create(name="Centre A")
+        self.medicine = Medicine.objects.create(name="Quinine", unit="cp")
+        MedicineReceipt.objects.create(center=self.center, medicine=self.medicine, quantity_received=10)
+
+    def etags(self, *urls):
+        return [self.client.get(url)['ETag'] for url in urls]
+
+    def run_command(self, name, *args):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(name, *args, stdout=StringIO())
+
+    def test_reconcile_stock_fix(self):
+        Stock.objects.update(total_quantity=3)
+        urls = ('/api/stocks/', '/api/dashboard/')
+        before = self.etags(*urls)
+
+        self.run_command('reconcile_stock', '--fix')
+        for url, etag in zip(urls, before):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get('/api/stocks/').data['results'][0]['total_quantity'], 10)
+
+    def test_rebuild_rollups(self):
+        week_start = week_monday(date.today())
+        WeeklyConsumptionReport.objects.create(
+            center=self.center, medicine=self.medicine, quantity_used=4,
+            week_start=week_start, week_end=week_start + timedelta(days=6),
+        )
+        ConsumptionRollup.objects.update(quantity_used=0)
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.data['charts']['weeklyConsumptionByCenter'], {})
+
+        self.run_command('rebuild_rollups')
+        response = self.client.get('/api/dashboard/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['charts']['weeklyConsumptionByCenter']["Centre A"][0]['totalUsed'], 4)
+
+
+class WeeklyReportImportTests(TestCase):
+    """The bulk sheet import creates valid rows and reports every other one by its sheet row."""
+
+    def setUp(self):
+        self.center = MedicalCenter.objects.create(name="Centre A")
+        self.medicine = Medicine.objects.create(name="Paracétamol", unit="cp")
+        MedicineReceipt.objects.create(center=self.center, medicine=self.medicine, quantity_received=20)
+
+    def test_import(self):
+        week = ('2024-01-01', '2024-01-07')
+        df = pd.DataFrame([
+            (*week, "centre a", "PARACETAMOL", 5),
+            (*week, "Centre A", "Paracétamol", 5),
+            (*week, "Centre A", "Paracetamoll", 5),
+            ('pas une date', '2024-01-07', "Centre A", "Paracétamol", 5),
+            ('2024-01-08', '2024-01-14', "Centre A", "Paracétamol", 50),
+        ], columns=WEEKLY_REPORT_COLUMNS)
+
+        success_count, errors = import_weekly_reports(df)
+        self.assertEqual(success_count, 1)
+        self.assertEqual([error["row"] for error in errors], [3, 4, 5, 6])
+        self.assertIn("already exists", errors[0]["error"])
+        self.assertIn("Did you mean 'Paracétamol'?", errors[1]["error"])
+        self.assertIn("Not enough stock", errors[3]["error"])
+
+        report = WeeklyConsumptionReport.objects.get()
+        self.assertEqual((report.center, report.medicine, report.quantity_used), (self.center, self.medicine, 5))
+        self.assertEqual(Stock.objects.get().total_quantity, 15)
+        self.assertEqual(ConsumptionRollup.objects.filter(quantity_used=5).count(), 2)
+
+    def test_quantity_zero_or_more(self):
+        week = ('2024-01-01', '2024-01-07')
+        df = pd.DataFrame([
+            (*week, "Centre A", "Paracétamol", 0),
+            ('2024-01-08', '2024-01-14', "Centre A", "Paracétamol", -1),
+        ], columns=WEEKLY_REPORT_COLUMNS)
+
+        success_count, errors = import_weekly_reports(df)
+        self.assertEqual(success_count, 1)
+        self.assertEqual(errors, [{"row": 3, "error": "Quantité utilisée must be a number, zero or more"}])
+
+
+class ReceiptImportTests(TestCase):
+    """The receipt sheet import is all or nothing and creates each new name once."""
+
+    def setUp(self):
+        self.center = MedicalCenter.objects.create(name="Centre A")
+
+    def sheet(self, *rows):
+        return pd.DataFrame(list(rows), columns=RECEIPT_COLUMNS)
+
+    def test_import(self):
+        created_count, errors = import_medicine_receipts(self.sheet(
+            ("centre a", "Zinc", "cp", 10, '02/01/2024', '30/06/2025'),
+            ("Centre A", "ZINC", "cp", 5, '09/01/2024', None),
+            ("Centre B", "Zinc", "cp", 7, '09/01/2024', '30/06/2025'),
+        ))
+        self.assertEqual((created_count, errors), (3, []))
+        self.assertEqual(list(Medicine.objects.values_list('name', flat=True)), ["Zinc"])
+        self.assertEqual(MedicalCenter.objects.count(), 2)
+        self.assertEqual(
+            list(MedicineBatch.objects.order_by('id').values_list('received_date', 'exp_date'))[:2],
+            [(date(2024, 1, 2), date(2025, 6, 30)), (date(2024, 1, 9), None)],
+        )
+        self.assertEqual(
+            dict(Stock.objects.values_list('center__name', 'total_quantity')), {"Centre A": 15, "Centre B": 7},
+        )
+
+    def test_invalid_row_writes_nothing(self):
+        created_count, errors = import_medicine_receipts(self.sheet(
+            ("Centre A", "Zinc", "cp", 10, '02/01/2024', '30/06/2025'),
+            ("Centre A", "Zinc", "cp", -1, '09/01/2024', None),
+        ))
+        self.assertEqual((created_count, errors), (0, [{"row": 3, "error": "Quantité Reçue must be a number, zero or more"}]))
+        self.assertFalse(Medicine.objects.exists())
+        self.assertFalse(MedicineReceipt.objects.exists())
+
+
+def excel_bytes(columns, rows=()):
+    buffer = BytesIO()
+    pd.DataFrame(list(rows), columns=columns).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+class ImportJobTests(TestCase):
+    """Queued uploads, the worker's bookkeeping and the recovery of jobs a dead worker left running."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('nurse', password='x'))
+
+    def create_job(self, kind, **fields):
+        return ImportJob.objects.create(kind=kind, file_name='sheet.xlsx', file_content=excel_bytes(['Autre']), **fields)
+
+    def upload(self, **params):
+        sheet = SimpleUploadedFile('receipts.xlsx', excel_bytes(RECEIPT_COLUMNS))
+        url = '/api/receipts-excel/upload/' + (f"?async={params['async']}" if params else '')
+        return self.client.post(url, {'file': sheet}, format='multipart')
+
+    def test_uploads_are_queued_on_request(self):
+        self.assertEqual(self.upload().status_code, 201)
+        response = self.upload(**{'async': '1'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(ImportJob.objects.get(pk=response.data['job']['id']).status, ImportJob.PENDING)
+        with override_settings(IMPORT_ASYNC=True):
+            self.assertEqual(self.upload().status_code, 202)
+            self.assertEqual(self.upload(**{'async': '0'}).status_code, 201)
+        self.assertEqual(ImportJob.objects.count(), 2)
+
+    def test_failure_keeps_progress(self):
+        self.create_job(ImportJob.WEEKLY_REPORTS)
+        job = claim_next_job()
+        # Rows the importer reported done before failing.
+        ImportJob.objects.filter(pk=job.pk).update(rows_processed=4)
+
+        run_import_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertIn("must contain these columns", job.message)
+        self.assertEqual(job.rows_processed, 4)
+        self.assertIsNotNone(job.finished_at)
+
+    @override_settings(IMPORT_JOB_TIMEOUT_MINUTES=30)
+    def test_stale_jobs_are_reclaimed(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        reports = self.create_job(ImportJob.WEEKLY_REPORTS, status=ImportJob.RUNNING, started_at=long_ago)
+        receipts = self.create_job(ImportJob.RECEIPTS, status=ImportJob.RUNNING, started_at=long_ago)
+        running = self.create_job(ImportJob.RECEIPTS, status=ImportJob.RUNNING, started_at=timezone.now())
+
+        job = claim_next_job()
+        self.assertEqual(job.pk, reports.pk)
+        self.assertGreater(job.started_at, long_ago)
+        receipts.refresh_from_db()
+        self.assertEqual(receipts.status, ImportJob.FAILED)
+        running.refresh_from_db()
+        self.assertEqual(running.status, ImportJob.RUNNING)
+        self.assertIsNone(claim_next_job())
+
+
+@override_settings(SYNC_OVERLAP_SECONDS=0)
+class SyncTests(TestCase):
+    """/sync/ sends everything first, then only what changed since the client's token."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('nurse', password='x'))
+        self.center = MedicalCenter.objects.create(name="Centre A")
+        self.closed = MedicalCenter.objects.create(name="Centre B")
+        Medicine.objects.create(name="Quinine", unit="cp")
+
+    def sync(self, **params):
+        return self.client.get('/api/sync/', params)
+
+    def test_full_then_delta(self):
+        first = self.sync().data
+        self.assertTrue(first['full'])
+        self.assertEqual(len(first['centers']['updated']), 2)
+
+        medicine = Medicine.objects.create(name="Zinc", unit="cp")
+        closed_id = self.closed.id
+        self.closed.delete()
+
+        delta = self.sync(since=first['token']).data
+        self.assertFalse(delta['full'])
+        self.assertEqual(delta['centers'], {"updated": [], "deleted": [closed_id]})
+        self.assertEqual([row['id'] for row in delta['medicines']['updated']], [medicine.id])
+        self.assertEqual(delta['medicines']['deleted'], [])
+
+    def test_expired_or_invalid_token(self):
+        self.assertTrue(self.sync(since='0').data['full'])
+        self.assertEqual(self.sync(since='yesterday').status_code, 400)
+
+
+class WeeklyReportExportTests(TestCase):
+    """Exports read back as the rows they were built from."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('nurse', password='x'))
+        medicine = Medicine.objects.create(name="Quinine", unit="cp")
+        for name, quantities in (("Centre A", (5, 3)), ("Centre B", (4,))):
+            center = MedicalCenter.objects.create(name=name)
+            MedicineReceipt.objects.create(center=center, medicine=medicine, quantity_received=20)
+            for week, quantity_used in enumerate(quantities):
+                week_start = date(2024, 1, 1) + timedelta(weeks=week)
+                WeeklyConsumptionReport.objects.create(
+                    center=center, medicine=medicine, quantity_used=quantity_used,
+                    week_start=week_start, week_end=week_start + timedelta(days=6),
+                )
+
+    def export(self, **params):
+        response = self.client.get('/api/reports/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_xlsx(self):
+        # Row 1 is the title, row 2 the headers.
+        df = pd.read_excel(BytesIO(self.export()), header=1)
+        self.assertEqual(list(df.columns), WEEKLY_REPORT_HEADERS)
+        self.assertEqual(len(df), 3)
+        self.assertEqual(df["Semaine du"].tolist(), ['08-01-2024', '01-01-2024', '01-01-2024'])
+        self.assertEqual(df["Quantité Consommée"].sum(), 12)
+
+    def test_csv(self):
+        rows = list(csv.reader(self.export(format='csv').decode().splitlines()))
+        self.assertEqual(rows[0], WEEKLY_REPORT_HEADERS)
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1][:4], ['08-01-2024', '14-01-2024', "Centre A", "Quinine"])
+
+    @skipUnless(parquet_available(), "pyarrow or fastparquet is not installed")
+    def test_parquet(self):
+        df = pd.read_parquet(BytesIO(self.export(format='parquet')))
+        self.assertEqual(list(df.columns), WEEKLY_REPORT_HEADERS)
+        self.assertEqual(len(df), 3)
+        self.assertEqual(df["Semaine du"].iloc[0], date(2024, 1, 8))
+
+    def test_group_by(self):
+        expected = {"Centre A": 8, "Centre B": 4}
+        rows = list(csv.reader(self.export(format='csv', group_by='center').decode().splitlines()))
+        self.assertEqual(rows[0], ["Centre médical", "Quantité Consommée"])
+        self.assertEqual({center: int(total) for center, total in rows[1:]}, expected)
+
+        df = pd.read_excel(BytesIO(self.export(group_by='center')), header=1)
+        self.assertEqual(dict(zip(df["Centre médical"], df["Quantité Consommée"])), expected)
+
+        rows = list(csv.reader(self.export(format='csv', group_by='week,medicine').decode().splitlines()))
+        self.assertEqual(rows[0], ["Semaine du", "Semaine au", "Nom du Médicament", "Unité", "Quantité Consommée"])
+        self.assertEqual([row[-1] for row in rows[1:]], ['3', '9'])
+
+    def test_invalid_format_or_group(self):
+        for params in ({'format': 'pdf'}, {'group_by': 'year'}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/reports/export/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.data)
+
+
+class MedicineSearchTests(TestCase):
+    """GET /medicines/search/ ranks exact names, then prefixes, then near spellings."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('nurse', password='x'))
+        for name in ("Quinidine", "Quinine Sulfate", "Quinine", "Paracétamol", "Amoxicilline"):
+            Medicine.objects.create(name=name, unit="cp")
+
+    def search(self, **params):
+        return self.client.get('/api/medicines/search/', params)
+
+    def names(self, q, **params):
+        return [row['name'] for row in self.search(q=q, **params).data]
+
+    def test_ranking(self):
+        response = self.search(q='quinine')
+        self.assertEqual([row['name'] for row in response.data], ["Quinine", "Quinine Sulfate", "Quinidine"])
+        self.assertEqual([row['score'] for row in response.data][:2], [1.0, 1.0])
+        self.assertLess(response.data[2]['score'], 1)
+        self.assertEqual(response.data[0]['unit'], "cp")
+
+    def test_case_accents_and_typos(self):
+        self.assertEqual(self.names('PARACETAMOL'), ["Paracétamol"])
+        self.assertEqual(self.names('amoxiciline')[:1], ["Amoxicilline"])
+        self.assertEqual(self.names('zinc'), [])
+
+    def test_limit(self):
+        Medicine.objects.bulk_create([Medicine(name=f"Quinine {i}", unit="cp") for i in range(60)])
+        self.assertEqual(len(self.names('quinine')), 10)
+        self.assertEqual(len(self.names('quinine', limit=2)), 2)
+        self.assertEqual(len(self.names('quinine', limit=500)), 50)
+        self.assertEqual(len(self.names('quinine', limit=0)), 1)
+        self.assertEqual(self.search(q='quinine', limit='many').status_code, 400)
+
+    def test_empty_query(self):
+        for params in ({}, {'q': '  '}):
+            with self.subTest(params=params):
+                self.assertEqual(self.search(**params).status_code, 400)
+
+
+class DashboardTests(TestCase):
+    """The cached dashboard and the paged receipts table that replaces its ?include=receipts."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('nurse', password='x'))
+        center = MedicalCenter.objects.create(name="Centre A")
+        medicine = Medicine.objects.create(name="Quinine", unit="cp")
+        for day in (1, 3, 2):
+            MedicineReceipt.objects.create(
+                center=center, medicine=medicine, quantity_received=day, received_date=date(2024, 1, day),
+            )
+
+    def test_cache_header(self):
+        self.assertEqual(self.client.get('/api/dashboard/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/dashboard/')['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/api/dashboard/', {'include': 'receipts'})['X-Cache'], 'MISS')
+
+    @override_settings(DASHBOARD_RECEIPTS_LIMIT=2)
+    def test_receipts_table_is_capped(self):
+        table = self.client.get('/api/dashboard/', {'include': 'receipts'}).data['tables']['Receipts']
+        self.assertEqual([row['quantity__received'] for row in table], [3, 2])
+
+    def test_paged_receipts_match_legacy_rows(self):
+        legacy = self.client.get('/api/dashboard/', {'include': 'receipts'}).data['tables']['Receipts']
+        rows = []
+        response = self.client.get('/api/dashboard/receipts/', {'page_size': 2})
+        while True:
+            rows += response.data['results']
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual(rows, legacy)
+        self.assertEqual(
+            list(rows[0]),
+            ['center_name', 'medicine_name', 'unit', 'quantity__received', 'expiration_date', 'received__date'],
+        )
+
+
+class ConditionalListTests(TestCase):
+    """ETags follow the shared table versions, whichever process wrote."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('nurse', password='x'))
+        Medicine.objects.create(name="Amoxicilline", unit="gél")
+        Medicine.objects.create(name="Quinine", unit="cp")
+
+    def revalidate(self, etag):
+        return self.client.get('/api/medicines/', HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.client.get('/api/medicines/')['ETag']
+        self.assertEqual(self.revalidate(etag).status_code, 304)
+
+    def test_write_changes_etag(self):
+        etag = self.client.get('/api/medicines/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Medicine.objects.create(name="Artéméther", unit="cp")
+
+        response = self.revalidate(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 3)
+
+    def test_bump_from_another_process(self):
+        etag = self.client.get('/api/medicines/')['ETag']
+        # What another worker's committed write leaves behind: the row and the version bump.
+        Medicine.objects.bulk_create([Medicine(name="Artéméther", unit="cp")])
+        TableVersion.objects.filter(table=MEDICINES).update(version=F('version') + 1)
+
+        response = self.revalidate(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 3)
+
+
+@skipUnless(orjson_available(), "orjson is not installed")
+class FastJSONTests(SimpleTestCase):
+    """The orjson renderer and parser are drop-in replacements for DRF's."""
+
+    data = {
+        "date": date(2024, 1, 31),
+        "datetime": datetime(2024, 1, 31, 8, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        "naive": datetime(2024, 1, 31, 8, 30),
+        "decimal": Decimal("12.50"),
+        "keys": {1: "one", 2.5: "two and a half", None: "none"},
+        "text": "Paracétamol\u2028",
+        "rows": [{"quantity": 3, "ratio": 0.25, "empty": None}],
+    }
+
+    def test_renders_like_json_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_integers_wider_than_64_bits(self):
+        data = {"big": 2 ** 70, "negative": -2 ** 64}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parses_like_json_parser(self):
+        body = JSONRenderer().render(self.data)
+        self.assertEqual(FastJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
+
+
+@skipUnless(brotli_available(), "brotli is not installed")
+class CompressionTests(SimpleTestCase):
+    """Brotli for plain API payloads; gzip, with its BREACH padding, where secrets may be reflected."""
+
+    def compress(self, path, cookie=False):
+        request = RequestFactory().get(path, HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        response = HttpResponse(b'{"name": "Quinine"}' * 100, content_type='application/json')
+        if cookie:
+            response.set_cookie('sessionid', 'secret')
+        return CompressionMiddleware(lambda request: response)(request)['Content-Encoding']
+
+    def test_brotli_for_api_payloads(self):
+        self.assertEqual(self.compress('/api/medicines/'), 'br')
+
+    def test_gzip_where_secrets_may_be_reflected(self):
+        self.assertEqual(self.compress('/api/auth/login/'), 'gzip')
+        self.assertEqual(self.compress('/api/medicines/', cookie=True), 'gzip')
+
+
+class CatalogueTests(TransactionTestCase):
+    """
+    Name lookups served from the per-process catalogue. Writes commit as they would in
+    production: inside a test transaction, pending version bumps keep the catalogue uncached.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('nurse', password='x'))
+        center = MedicalCenter.objects.create(name="Centre A")
+        # Names are not unique: older imports matched them case-sensitively.
+        self.medicines = [
+            Medicine.objects.create(name=name, unit="cp") for name in ("Paracetamol", "PARACETAMOL", "Paracétamol")
+        ]
+        Medicine.objects.create(name="Quinine", unit="cp")
+        Stock.objects.bulk_create([Stock(center=center, medicine=medicine) for medicine in self.medicines])
+
+    def test_search_keeps_every_matching_row(self):
+        self.assertEqual(self.client.get('/api/stocks/', {'medicine_name': 'para'}).data['count'], 3)
+        self.assertEqual(len(self.client.get('/api/medicines/', {'search': 'para'}).data), 3)
+
+    @override_settings(CATALOGUE_SEARCH_MAX_IDS=2)
+    def test_broad_search_is_left_to_the_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/stocks/', {'medicine_name': 'para'}).data['count'], 3)
+        self.assertTrue(any('LIKE' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(len(self.client.get('/api/medicines/', {'search': 'PARA'}).data), 3)
+
+    def test_resolution_picks_oldest_row(self):
+        self.assertEqual(resolve_names(Medicine, ["paracétamol"]), {"paracetamol": self.medicines[0].id})
+
+    def test_rows_written_by_another_process(self):
+        resolve_names(Medicine, ["Amoxicilline"])
+        self.assertIn((Medicine, _ids_by_key), _catalogues)
+        # Another worker's committed import: rows without signals here, and its version bump.
+        new = Medicine.objects.bulk_create([Medicine(name="Amoxicilline", unit="gél")])[0]
+        TableVersion.objects.filter(table=MEDICINES).update(version=F('version') + 1)
+
+        self.assertEqual(resolve_names(Medicine, ["amoxicilline"]), {"amoxicilline": new.id})
+        self.assertEqual(len(self.client.get('/api/medicines/', {'search': 'amox'}).data), 1)
@@ -5,7 +5,9 @@ from .views import (
     MedicineReceiptViewSet, WeeklyConsumptionReportViewSet,
     WeeklyReportExcelUploadView, MedicineReceiptExcelUploadView,
     WeeklyReportExcelExportView,DashboardAnalyticsView,
-    DashboardAnalyticsView,
+    DashboardAnalyticsView, ImportJobViewSet, DashboardReceiptsView,
+    ConsumptionPerCenterView, StockPerCenterView, TopMedicinesView, ConsumptionVelocityView,
+    StockOutForecastView, ExpiryRiskView, MedicineBatchViewSet, SyncView,
 )
 
 router = DefaultRouter()
@@ -13,11 +15,21 @@ router.register(r'centers', MedicalCenterViewSet)
 router.register(r'medicines', MedicineViewSet)
 router.register(r'stocks', StockViewSet)
 router.register(r'receipts', MedicineReceiptViewSet)
+router.register(r'batches', MedicineBatchViewSet, basename='medicinebatch')
 router.register(r'weekly/reports', WeeklyConsumptionReportViewSet)
+router.register(r'imports', ImportJobViewSet, basename='importjob')
 
 urlpatterns = router.urls + [
     path('weekly-excel/reports/upload/', WeeklyReportExcelUploadView.as_view(), name='weeklyreport-upload'),
     path('reports/export/', WeeklyReportExcelExportView.as_view(), name='weeklyreports-export'),
     path('receipts-excel/upload/', MedicineReceiptExcelUploadView.as_view(), name='receipts'),
     path('dashboard/', DashboardAnalyticsView.as_view(), name='dashboard-analytics'),
+    path('dashboard/receipts/', DashboardReceiptsView.as_view(), name='dashboard-receipts'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('analytics/consumption/', ConsumptionPerCenterView.as_view(), name='analytics-consumption'),
+    path('analytics/stock/', StockPerCenterView.as_view(), name='analytics-stock'),
+    path('analytics/top-medicines/', TopMedicinesView.as_view(), name='analytics-top-medicines'),
+    path('analytics/velocity/', ConsumptionVelocityView.as_view(), name='analytics-velocity'),
+    path('analytics/forecast/', StockOutForecastView.as_view(), name='analytics-forecast'),
+    path('analytics/expiry-risk/', ExpiryRiskView.as_view(), name='analytics-expiry-risk'),
 ]
@@ -1,72 +1,314 @@
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import FileResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils.dateparse import parse_date
 from django.utils.timezone import now, timedelta
-from django.db.models import Sum, F, Value, Max
+from django.db.models import Sum, F, DateField, Value
 from django.db.models.functions import Coalesce, Concat
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import viewsets, filters, status
+from rest_framework import generics, viewsets, status
+from rest_framework.decorators import action
 from rest_framework.parsers import MultiPartParser
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 
 import pandas as pd
-from openpyxl import Workbook
-from openpyxl.utils import get_column_letter
-from io import BytesIO
 from datetime import datetime, date
 
-from .models import MedicalCenter, Medicine, Stock, MedicineReceipt, WeeklyConsumptionReport
+from .models import (
+    MedicalCenter, Medicine, Stock, MedicineReceipt, WeeklyConsumptionReport, ImportJob,
+    ConsumptionRollup, MedicineBatch, annotate_batch_flags,
+)
 from .serializers import (
     MedicalCenterSerializer, MedicineSerializer, StockSerializer,
     MedicineReceiptSerializer, WeeklyConsumptionReportSerializer,
-    WeeklyReportExcelUploadSerializer,
+    WeeklyReportExcelUploadSerializer, ImportJobSerializer, MedicineBatchSerializer,
+    MedicineReceiptBulkItemSerializer, WeeklyReportBulkItemSerializer, ValuesSerializer,
+)
+from .filters import (
+    CatalogueSearchFilter, StockFilter, WeeklyConsumptionReportFilter, MedicineReceiptFilter, MedicineBatchFilter,
+)
+from .importers import (
+    RECEIPT_COLUMNS, WEEKLY_REPORT_COLUMNS,
+    create_medicine_receipts, create_weekly_reports, import_medicine_receipts, import_weekly_reports,
+)
+from .jobs import enqueue_import
+from .analytics import services as analytics
+from .analytics.services import week_monday
+from .cache import CENTERS, MEDICINES, RECEIPTS, REPORTS, STOCK, DASHBOARD_TABLES, versioned_digest
+from .conditional import conditional, etag_matches, not_modified, with_etag
+from .pagination import KeysetPagination, SelectablePagination
+from .idempotency import IdempotentCreateMixin, idempotent
+from .search import search_names
+from .sync import decode_token, sync_changes
+from .exports import (
+    EXPORT_FORMATS, parse_group_by, parquet_available,
+    stream_weekly_report_csv, write_weekly_report_parquet, write_weekly_report_xlsx,
 )
-from .filters import StockFilter, WeeklyConsumptionReportFilter, MedicineReceiptFilter
 
-class MedicalCenterViewSet(viewsets.ModelViewSet):
+class ValuesListMixin:
+    """
+    Serve `list` from values() dicts through ValuesSerializer, so a page costs its queries
+    (count and rows) whatever its size and whether or not the queryset select_related.
+    Retrieve, create and update keep using serializer_class.
+    """
+    def list(self, request, *args, **kwargs):
+        reader = ValuesSerializer(self.get_serializer_class())
+        keyset = [field.lstrip('-') for field in getattr(self, 'keyset_ordering', ())]
+        queryset = reader.values(self.filter_queryset(self.get_queryset()), *keyset)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(reader.to_representation(page))
+        return Response(reader.to_representation(queryset))
+
+class MedicalCenterViewSet(ValuesListMixin, viewsets.ModelViewSet):
     permission_classes =  [IsAuthenticated]
 
     queryset = MedicalCenter.objects.all()
     serializer_class = MedicalCenterSerializer
 
-class MedicineViewSet(viewsets.ModelViewSet):
+    @conditional(CENTERS)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+class MedicineViewSet(ValuesListMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     queryset = Medicine.objects.all()
     serializer_class = MedicineSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name']
+    filter_backends = [CatalogueSearchFilter]
+    catalogue_search = (Medicine, 'id')
 
+    pagination_class = None  # the whole catalogue in one response
+
+    @conditional(MEDICINES)
     def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)  # bypass pagination
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['get'])
+    @conditional(MEDICINES)
+    def search(self, request):
+        """
+        Medicines closest to ?q=, ignoring case and accents and tolerating typos, best first
+        with their match score (0-1). ?limit= caps the results (default 10, at most 50).
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = query_int(request, 'limit', 10, maximum=50)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class StockViewSet(viewsets.ModelViewSet):
+        matches = search_names(Medicine, query, limit)
+        units = dict(Medicine.objects.filter(id__in=[pk for pk, _, _ in matches]).values_list('id', 'unit'))
+        return Response([
+            {"id": pk, "name": name, "unit": units.get(pk), "score": score} for pk, name, score in matches
+        ])
+
+class StockViewSet(ValuesListMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     
     queryset = Stock.objects.select_related('center', 'medicine').all()
     serializer_class = StockSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = StockFilter
+    pagination_class = SelectablePagination
+    keyset_ordering = ('center_id', 'medicine_id')
 
-class MedicineReceiptViewSet(viewsets.ModelViewSet):
+    @conditional(STOCK, CENTERS, MEDICINES)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+def validate_bulk_items(data, item_serializer_class):
+    """
+    Validate a bulk create body: a list of at most BULK_MAX_ITEMS objects, checked with one
+    serializer and with their center/medicine ids resolved in one query per table.
+    Returns (valid, errors, centers, medicines): validated data and error details keyed by
+    item index, and the referenced instances keyed by id. Returns None for a body that is
+    not such a list.
+    """
+    if not isinstance(data, list) or not data or len(data) > settings.BULK_MAX_ITEMS:
+        return None
+
+    serializer = item_serializer_class()
+    valid, errors = {}, {}
+    for index, item in enumerate(data):
+        try:
+            valid[index] = serializer.run_validation(item)
+        except ValidationError as e:
+            errors[index] = e.detail
+
+    centers = MedicalCenter.objects.in_bulk({item['center'] for item in valid.values()})
+    medicines = Medicine.objects.in_bulk({item['medicine'] for item in valid.values()})
+    for index, item in list(valid.items()):
+        unknown = {
+            field: [f'Invalid pk "{item[field]}" - object does not exist.']
+            for field, known in (('center', centers), ('medicine', medicines))
+            if item[field] not in known
+        }
+        if unknown:
+            errors[index] = unknown
+            del valid[index]
+    return valid, errors, centers, medicines
+
+def bulk_response(created, errors):
+    """Per-item results in request order: 201 if all were created, 400 if none, 207 otherwise."""
+    results = [{"index": index, "status": "created", "data": data} for index, data in created.items()]
+    results += [{"index": index, "status": "error", "errors": detail} for index, detail in errors.items()]
+    results.sort(key=lambda result: result["index"])
+    if not errors:
+        code = status.HTTP_201_CREATED
+    elif not created:
+        code = status.HTTP_400_BAD_REQUEST
+    else:
+        code = status.HTTP_207_MULTI_STATUS
+    return Response({"created": len(created), "failed": len(errors), "results": results}, status=code)
+
+def invalid_bulk_body_response():
+    return Response(
+        {"error": f"Expected a list of 1 to {settings.BULK_MAX_ITEMS} objects."},
+        status=status.HTTP_400_BAD_REQUEST,
+    )
+
+class MedicineReceiptViewSet(IdempotentCreateMixin, ValuesListMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     queryset = MedicineReceipt.objects.select_related('center', 'medicine').all()
     serializer_class = MedicineReceiptSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = MedicineReceiptFilter
+    pagination_class = SelectablePagination
+    keyset_ordering = ('-received_date', 'id')
+
+    @conditional(RECEIPTS, CENTERS, MEDICINES)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def bulk(self, request):
+        """
+        Create up to BULK_MAX_ITEMS receipts from a JSON list, all or nothing: if any item
+        is invalid nothing is written and the per-item errors are returned with a 400.
+        """
+        parsed = validate_bulk_items(request.data, MedicineReceiptBulkItemSerializer)
+        if parsed is None:
+            return invalid_bulk_body_response()
+        valid, errors, centers, medicines = parsed
+        if errors:
+            return bulk_response({}, errors)
+
+        frame = pd.DataFrame.from_records([
+            {
+                'center_id': item['center'],
+                'medicine_id': item['medicine'],
+                'quantity': item['quantity_received'],
+                'received_date': item.get('received_date') or date.today(),
+                'exp_date': item.get('exp_date'),
+            }
+            for item in valid.values()
+        ], columns=['center_id', 'medicine_id', 'quantity', 'received_date', 'exp_date'])
+        receipts = create_medicine_receipts(frame, centers, medicines)
+        data = MedicineReceiptSerializer(receipts, many=True).data
+        return bulk_response(dict(zip(valid, data)), {})
 
-class WeeklyConsumptionReportViewSet(viewsets.ModelViewSet):
+class WeeklyConsumptionReportViewSet(IdempotentCreateMixin, ValuesListMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = WeeklyConsumptionReport.objects.select_related('center', 'medicine').all()
     serializer_class = WeeklyConsumptionReportSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, CatalogueSearchFilter]
     filterset_class = WeeklyConsumptionReportFilter
-    search_fields = ['medicine__name']
+    catalogue_search = (Medicine, 'medicine_id')
+    pagination_class = SelectablePagination
+    keyset_ordering = ('-week_end', 'id')
+
+    @conditional(REPORTS, CENTERS, MEDICINES)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def bulk(self, request):
+        """
+        Create up to BULK_MAX_ITEMS weekly reports from a JSON list. Each item succeeds or
+        fails on its own (invalid data, duplicate week, not enough stock); consumption is
+        applied once per (center, medicine) like the Excel import.
+        """
+        parsed = validate_bulk_items(request.data, WeeklyReportBulkItemSerializer)
+        if parsed is None:
+            return invalid_bulk_body_response()
+        valid, errors, centers, medicines = parsed
+
+        frame = pd.DataFrame.from_records([
+            {
+                'row': index,
+                'center_id': item['center'],
+                'medicine_id': item['medicine'],
+                'week_start': item['week_start'],
+                'week_end': item['week_end'],
+                'quantity_used': item['quantity_used'],
+            }
+            for index, item in valid.items()
+        ], columns=['row', 'center_id', 'medicine_id', 'week_start', 'week_end', 'quantity_used'])
+        reports, create_errors = create_weekly_reports(frame, centers, medicines)
+        for error in create_errors:
+            errors[error["row"]] = {"non_field_errors": [error["error"]]}
+        created = {
+            index: WeeklyConsumptionReportSerializer(report).data for index, report in reports.items()
+        }
+        return bulk_response(created, errors)
+
+class MedicineBatchViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Batches, earliest expiry first and undated last, as FEFO consumes them, in both
+    pagination modes. Filters: center, medicine, expiring_before (date) and non_empty;
+    non_empty=true with a center or an expiry bound is served by the partial batch indexes.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = MedicineBatchSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = MedicineBatchFilter
+    pagination_class = SelectablePagination
+    # Cursors need non-null keys: undated batches sort as expiring on date.max.
+    keyset_ordering = ('expiry_order', 'id')
+
+    def get_queryset(self):
+        queryset = MedicineBatch.objects.annotate(
+            expiry_order=Coalesce('exp_date', Value(date.max, output_field=DateField())),
+        )
+        return annotate_batch_flags(queryset.order_by('expiry_order', 'id'))
+
+def wants_async_import(request):
+    """Whether to queue the upload: as `?async=` says, IMPORT_ASYNC when it is absent."""
+    value = request.query_params.get('async')
+    if value is None:
+        return settings.IMPORT_ASYNC
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def queued_import_response(job):
+    return Response({
+        "message": "Import queued.",
+        "job": ImportJobSerializer(job).data,
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+class ImportJobViewSet(viewsets.ReadOnlyModelViewSet):
+    permission_classes = [IsAuthenticated]
+    serializer_class = ImportJobSerializer
+
+    def get_queryset(self):
+        queryset = ImportJob.objects.defer('file_content')
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(created_by=self.request.user)
 
 class WeeklyReportExcelUploadView(APIView):
     permission_classes = [IsAuthenticated]
@@ -77,48 +319,14 @@ class WeeklyReportExcelUploadView(APIView):
         serializer.is_valid(raise_exception=True)
         file = serializer.validated_data['file']
 
+        if wants_async_import(request):
+            return queued_import_response(enqueue_import(ImportJob.WEEKLY_REPORTS, file, request.user))
+
         df = pd.read_excel(file)
-        required_columns = ['Date de début de semaine', 'Date de fin de semaine', 'Centre médical', 'Médicament', 'Quantité utilisée']
-        if not all(col in df.columns for col in required_columns):
-            return Response({"error": "Excel file must contain these columns: " + ", ".join(required_columns)}, status=status.HTTP_400_BAD_REQUEST)
-
-        success_count = 0
-        errors = []
-        
-        # Convert week_start and week_end to datetime if necessary
-        df['Date de début de semaine'] = pd.to_datetime(df['Date de début de semaine'], errors='coerce')
-        df['Date de fin de semaine'] = pd.to_datetime(df['Date de fin de semaine'], errors='coerce')
-
-        for idx, row in df.iterrows():
-            try:
-                center_name = row['Centre médical']
-                center_name = str(center_name).strip().replace('\u00a0', ' ')
-
-                try:
-                    # Try case-insensitive match
-                    center = MedicalCenter.objects.get(name__iexact=center_name)
-                except MedicalCenter.DoesNotExist:
-                    errors.append({"row": idx + 2, "error": f"MedicalCenter '{row['Centre médical']}' does not exist"})
-                    continue
-
-                medicine_name = str(row['Médicament']).strip().replace('\u00a0', ' ')
-                try:
-                    medicine = Medicine.objects.get(name__iexact=medicine_name)
-                except Medicine.DoesNotExist:
-                    errors.append({"row": idx + 2, "error": f"Medicine '{row['Médicament']}' does not exist"})
-                    continue
-
-                # Create WeeklyConsumptionReport
-                report = WeeklyConsumptionReport.objects.create(
-                    week_start=row['Date de début de semaine'],
-                    week_end=row['Date de fin de semaine'],
-                    center=center,
-                    medicine=medicine,
-                    quantity_used=int(row['Quantité utilisée'])
-                )
-                success_count += 1
-            except Exception as e:
-                errors.append({"row": idx + 2, "error": str(e)})
+        if not all(col in df.columns for col in WEEKLY_REPORT_COLUMNS):
+            return Response({"error": "Excel file must contain these columns: " + ", ".join(WEEKLY_REPORT_COLUMNS)}, status=status.HTTP_400_BAD_REQUEST)
+
+        success_count, errors = import_weekly_reports(df)
 
         return Response({
             "message": f"Successfully uploaded {success_count} reports.",
@@ -134,151 +342,161 @@ class MedicineReceiptExcelUploadView(APIView):
         if not file_obj:
             return Response({"error": "No file provided."}, status=status.HTTP_400_BAD_REQUEST)
 
+        if wants_async_import(request):
+            return queued_import_response(enqueue_import(ImportJob.RECEIPTS, file_obj, request.user))
+
         try:
             df = pd.read_excel(file_obj)
         except Exception as e:
             return Response({"error": f"Invalid Excel file. Details: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
-        required_columns = ['Centre médical', 'Nom du Médicament', 'Unité', 'Quantité Reçue', 'Date de Réception', 'Date de Peramption']
-        if not all(col in df.columns for col in required_columns):
-            return Response({"error": "Excel file must contain these columns: " + ", ".join(required_columns)}, status=status.HTTP_400_BAD_REQUEST)
-
-        receipts_created = []
-
-        for _, row in df.iterrows():
-            try:
-                center_name = row['Centre médical']
-                center_name = str(center_name).strip().replace('\u00a0', ' ')
-
-                medicine_name = row['Nom du Médicament']
-                medicine_name = str(medicine_name).strip().replace('\u00a0', ' ')
-
-                unit = row['Unité']
-                quantity = int(row['Quantité Reçue'])
-                received_date = pd.to_datetime(row['Date de Réception'], dayfirst=True).date()
-                expiration_date = pd.to_datetime(row['Date de Peramption'], dayfirst=True).date()
-
-
-                try:
-                    center = MedicalCenter.objects.get(name=center_name)
-                except center.DoesNotExist:
-                    center = MedicalCenter.objects.create(name=center_name)
-
-                medicine, _ = Medicine.objects.get_or_create(name=medicine_name, defaults={'unit': unit})
+        if not all(col in df.columns for col in RECEIPT_COLUMNS):
+            return Response({"error": "Excel file must contain these columns: " + ", ".join(RECEIPT_COLUMNS)}, status=status.HTTP_400_BAD_REQUEST)
 
-                receipt = MedicineReceipt.objects.create(
-                    center=center,
-                    medicine=medicine,
-                    quantity_received=quantity,
-                    exp_date=expiration_date,
-                    received_date=received_date
-                )
+        created_count, errors = import_medicine_receipts(df)
+        if errors:
+            return Response({
+                "error": f"No receipts were created: {len(errors)} invalid rows.",
+                "errors": errors
+            }, status=status.HTTP_400_BAD_REQUEST)
 
-                receipts_created.append(receipt.id)
+        return Response({"message": f"Successfully created {created_count} medicine receipts."}, status=status.HTTP_201_CREATED)
+    
+class ExportContentNegotiation(DefaultContentNegotiation):
+    """On the export endpoint `?format=` picks the file type, not a DRF renderer."""
 
-            except Exception as e:
-                return Response({"error": f"Error processing row: {row.to_dict()}. Details: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
 
-        return Response({"message": f"Successfully created {len(receipts_created)} medicine receipts."}, status=status.HTTP_201_CREATED)
-    
 class WeeklyReportExcelExportView(APIView):
     permission_classes = [IsAuthenticated]
+    content_negotiation_class = ExportContentNegotiation
+
     def get(self, request, *args, **kwargs):
         # Parse query params
         start_date = parse_date(str(request.query_params.get('start')))
         end_date = parse_date(str(request.query_params.get('end')))
+        export_format = request.query_params.get('format', 'xlsx').lower()
+        if export_format not in EXPORT_FORMATS:
+            return Response({"error": "format must be one of: " + ", ".join(EXPORT_FORMATS)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            group_by = parse_group_by(request.query_params.get('group_by'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         # Base queryset
-        reports = WeeklyConsumptionReport.objects.select_related('medicine', 'center')
+        reports = WeeklyConsumptionReport.objects.all()
 
         # Apply date filtering if provided
         if start_date and end_date:
             reports = reports.filter(week_end__gte=start_date, week_start__lte=end_date)
 
         reports = reports.order_by('-week_start')
+        filename = f"Weekly_Report_{datetime.now().strftime('%d%m%Y_%H%M%S')}.{export_format}"
 
-        # Create workbook and sheet
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Weekly Consumption Report"
-
-        # Add title
-        ws.merge_cells("A1:H1")
-        ws["A1"] = f"Weekly Medicine Consumption Report - Generated {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-        ws["A1"].style = "Title"
-
-        # Define headers
-        headers = [
-            "Semaine du", "Semaine au", "Centre médical", "Nom du Médicament",
-            "Unité", "Quantité Consommée", "Observation"
-        ]
-        ws.append(headers)
-
-        # Add data
-        for report in reports:
-            ws.append([
-                report.week_start.strftime('%d-%m-%Y'),
-                report.week_end.strftime('%d-%m-%Y'),
-                report.center.name,
-                report.medicine.name,
-                report.medicine.unit,
-                report.quantity_used,
-                report.observation
-            ])
-
-        # Auto-adjust column widths
-        for i, col in enumerate(ws.columns, start=1):
-            max_length = max(len(str(cell.value)) if cell.value else 0 for cell in col)
-            ws.column_dimensions[get_column_letter(i)].width = max_length + 2
-
-        # Save to memory
-        excel_file = BytesIO()
-        wb.save(excel_file)
-        excel_file.seek(0)
-
-        # Return response
-        filename = f"Weekly_Report_{datetime.now().strftime('%d%m%Y_%H%M%S')}.xlsx"
-        response = HttpResponse(
-            excel_file,
+        if export_format == 'csv':
+            response = StreamingHttpResponse(
+                stream_weekly_report_csv(reports, group_by),
+                content_type='text/csv; charset=utf-8'
+            )
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
+
+        if export_format == 'parquet':
+            if not parquet_available():
+                return Response({"error": "Parquet export requires pyarrow to be installed on the server."}, status=status.HTTP_501_NOT_IMPLEMENTED)
+            return FileResponse(
+                write_weekly_report_parquet(reports, group_by),
+                as_attachment=True,
+                filename=filename,
+                content_type='application/vnd.apache.parquet'
+            )
+
+        # Stream the spooled file back in chunks
+        return FileResponse(
+            write_weekly_report_xlsx(reports, group_by),
+            as_attachment=True,
+            filename=filename,
             content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
+
+def dashboard_summary():
+    """The dashboard summary figures, collected with one round-trip of scalar subqueries."""
+    quote = connection.ops.quote_name
+    medicines = quote(Medicine._meta.db_table)
+    centers = quote(MedicalCenter._meta.db_table)
+    receipts = quote(MedicineReceipt._meta.db_table)
+    stocks = quote(Stock._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT (SELECT COUNT(*) FROM {medicines}),"
+            f" (SELECT COUNT(*) FROM {centers}),"
+            f" (SELECT COALESCE(SUM(quantity_received), 0) FROM {receipts}),"
+            f" (SELECT COALESCE(SUM(total_quantity), 0) FROM {stocks}),"
+            f" (SELECT MAX(received_date) FROM {receipts})"
+        )
+        total_medicines, total_centers, total_received, total_stock, last_receipt = cursor.fetchone()
+    return {
+        "totalMedicines": total_medicines,
+        "totalCenters": total_centers,
+        "totalReceivedQuantity": total_received,
+        "totalStockQuantity": total_stock,
+        "lastReceiptDate": DateField().to_python(last_receipt),
+    }
 
 class DashboardAnalyticsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    def includes_receipts(self, request):
+        return 'receipts' in request.query_params.get('include', '').split(',')
+
+    def get_digest(self, request):
+        # Every authenticated user currently sees the same dashboard, so the scope is global;
+        # the date is part of the key because the "last 4 weeks" windows move with it.
+        return versioned_digest(DASHBOARD_TABLES, 'global', date.today(), self.includes_receipts(request))
+
     def get(self, request, *args, **kwargs):
+        # One digest of the table versions names both the cached payload and its ETag, so an
+        # unchanged dashboard is answered with a 304 before the cache is even read.
+        digest = self.get_digest(request)
+        etag = f'"{digest}"'
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        cache_key = f"inventory:dashboard:{digest}"
+        data = cache.get(cache_key)
+        if data is None:
+            data = self.build_dashboard()
+            if self.includes_receipts(request):
+                data["tables"]["Receipts"] = self.build_receipts_table()
+            cache.set(cache_key, data, settings.DASHBOARD_CACHE_TIMEOUT)
+            cache_status = "MISS"
+        else:
+            cache_status = "HIT"
+
+        response = with_etag(Response(data), etag)
+        response['X-Cache'] = cache_status
+        return response
+
+    def build_dashboard(self):
         today = date.today()
         one_month_ago = today - timedelta(days=30)
         four_weeks_ago = today - timedelta(weeks=4)
 
         # ✅ Summary stats
-        summary = {
-            "totalMedicines": Medicine.objects.count(),
-            "totalCenters": MedicalCenter.objects.count(),
-            "totalReceivedQuantity": MedicineReceipt.objects.aggregate(
-                total=Coalesce(Sum('quantity_received'), Value(0))
-            )['total'],
-            "totalStockQuantity": Stock.objects.aggregate(
-                total=Coalesce(Sum('total_quantity'), Value(0))
-            )['total'],
-            "lastReceiptDate": MedicineReceipt.objects.aggregate(
-                latest=Coalesce(Max('received_date'), Value(None))
-            )['latest']
-        }
+        summary = dashboard_summary()
 
-        # ✅ Weekly consumption per center and medicine (last 4 weeks)
+        # ✅ Weekly consumption per center and medicine (last 4 ISO weeks), from the rollups
         weekly_consumption = (
-            WeeklyConsumptionReport.objects
-            .filter(week_start__gte=four_weeks_ago)
+            ConsumptionRollup.objects
+            .filter(period=ConsumptionRollup.WEEK, period_start__gte=week_monday(four_weeks_ago), quantity_used__gt=0)
             .values(
                 center_name=F('center__name'),
                 medicine_name=F('medicine__name'),
                 unit=F('medicine__unit'),
-                weekStart=F('week_start'),
-                weekEnd=F('week_end'),
+                weekStart=F('period_start'),
+                totalUsed=F('quantity_used'),
             )
-            .annotate(totalUsed=Sum('quantity_used'))
             .order_by('center', 'weekStart')
         )
 
@@ -286,7 +504,8 @@ class DashboardAnalyticsView(APIView):
         grouped_weekly = {}
         for item in weekly_consumption:
             center_name = item.pop('center_name')
-            period = f"{item.pop('weekStart')} to {item.pop('weekEnd')}"
+            week_start = item.pop('weekStart')
+            period = f"{week_start} to {week_start + timedelta(days=6)}"
             entry = {
                 "medicine": item['medicine_name'],
                 "unit": item['unit'],
@@ -334,29 +553,16 @@ class DashboardAnalyticsView(APIView):
             )
         )
 
-        receipts = (
-            MedicineReceipt.objects
-            .order_by('-received_date')
-            .values(
-                center_name=F('center__name'),
-                medicine_name=F('medicine__name'),
-                unit=F('medicine__unit'),
-                quantity__received=F('quantity_received'),
-                expiration_date=F('exp_date'),
-                received__date=F('received_date'),
-            )
-        )
-
         # ✅ Top 5 used medicines in last 30 days
         top_used_medicines = (
-            WeeklyConsumptionReport.objects
-            .filter(week_start__gte=one_month_ago)
+            ConsumptionRollup.objects
+            .filter(period=ConsumptionRollup.WEEK, period_start__gte=week_monday(one_month_ago))
             .values(name=F('medicine__name'), unit=F('medicine__unit'))
             .annotate(totalUsed=Sum('quantity_used'))
             .order_by('-totalUsed')[:5]
         )
 
-        return Response({
+        return {
             "summary": summary,
             "charts": {
                 "weeklyConsumptionByCenter": grouped_weekly,
@@ -365,9 +571,165 @@ class DashboardAnalyticsView(APIView):
             "tables": {
                 "stockPerCenter": list(stock_distribution),
                 "recentReceipts": list(recent_receipts),
-                "Receipts": list(receipts),
             },
             "alerts": {
                 "lowStock": list(low_stock_alerts),
+                "nearExpiry": analytics.get_expiry_risk_summary(settings.EXPIRY_ALERT_DAYS),
             }
-        })
+        }
+
+    def build_receipts_table(self):
+        """The legacy full "Receipts" table, only sent with ?include=receipts and capped."""
+        return list(
+            MedicineReceipt.objects
+            .order_by('-received_date', '-id')
+            .values(**receipts_table_columns())[:settings.DASHBOARD_RECEIPTS_LIMIT]
+        )
+
+def receipts_table_columns():
+    """The rows of the dashboard "Receipts" table, as the frontend reads them."""
+    return dict(
+        center_name=F('center__name'),
+        medicine_name=F('medicine__name'),
+        unit=F('medicine__unit'),
+        quantity__received=F('quantity_received'),
+        expiration_date=F('exp_date'),
+        received__date=F('received_date'),
+    )
+
+class DashboardReceiptsView(generics.ListAPIView):
+    """
+    All receipts for the dashboard table, newest first, keyset-paginated on (received_date,
+    id). Rows are those of the legacy ?include=receipts table.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-received_date', '-id')
+
+    def get_queryset(self):
+        # The ordering fields are only selected for the cursor and left out of the rows.
+        return MedicineReceipt.objects.values('id', 'received_date', **receipts_table_columns())
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        columns = receipts_table_columns()
+        return self.get_paginated_response([{name: row[name] for name in columns} for row in page])
+
+def query_date(request, name):
+    """Optional ISO date query parameter; raises ValueError when it is malformed."""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(f"Invalid {name} date. Use YYYY-MM-DD.")
+    return parsed
+
+def query_int(request, name, default, minimum=1, maximum=None):
+    """Integer query parameter clamped to [minimum, maximum]; raises ValueError when malformed."""
+    value = request.query_params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer.")
+    value = max(value, minimum)
+    return min(value, maximum) if maximum else value
+
+class ConsumptionPerCenterView(APIView):
+    """Units consumed per center, optionally restricted to reports overlapping ?start=&end=."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            start, end = query_date(request, 'start'), query_date(request, 'end')
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(analytics.get_total_consumed_per_center(start, end))
+
+class StockPerCenterView(APIView):
+    """Stock held per center; ?threshold= sets the low-stock cut-off (default 10)."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            threshold = query_int(request, 'threshold', 10, minimum=0)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(analytics.get_total_stock_per_center(threshold))
+
+class TopMedicinesView(APIView):
+    """Most consumed medicines; ?limit= (default 5, max 100) and ?since= (ISO date)."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = query_int(request, 'limit', 5, maximum=100)
+            since = query_date(request, 'since')
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(analytics.get_top_medicines(limit, since))
+
+class ConsumptionVelocityView(APIView):
+    """Average weekly consumption and trend per center and medicine over the last ?weeks= (default 8)."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            weeks = query_int(request, 'weeks', 8, maximum=104)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(analytics.get_consumption_velocity(weeks))
+
+class StockOutForecastView(APIView):
+    """
+    Days of cover and expected stock-out date per center and medicine, from the average
+    weekly consumption over the last ?weeks= (default 8). ?within=N keeps only the pairs
+    expected to run out within N days.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            weeks = query_int(request, 'weeks', 8, maximum=104)
+            within = query_int(request, 'within', None, minimum=0)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(analytics.forecast_stock_out(weeks, within))
+
+class ExpiryRiskView(APIView):
+    """
+    Non-empty batches expired or expiring within ?days= (default EXPIRY_ALERT_DAYS), grouped
+    by center, with the units projected to expire unused at the consumption rate of the last
+    ?weeks= (default 8). ?center= narrows it to one center; ?summary=true drops the batches.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            days = query_int(request, 'days', settings.EXPIRY_ALERT_DAYS, minimum=0, maximum=3650)
+            weeks = query_int(request, 'weeks', 8, maximum=104)
+            center = query_int(request, 'center', None)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if request.query_params.get('summary', '').lower() == 'true':
+            return Response(analytics.get_expiry_risk_summary(days, weeks))
+        return Response(analytics.get_expiry_risk(days, weeks, center))
+
+class SyncView(APIView):
+    """
+    Change feed for offline clients. GET /sync/ returns every center, medicine and stock row
+    with a token; GET /sync/?since=<token> returns only the rows created or updated and the
+    ids deleted since that token, with the token for the next call. `full: true` in a reply
+    means the client must replace its copy rather than merge it.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        token = request.query_params.get('since')
+        try:
+            since = decode_token(token) if token else None
+        except (ValueError, OverflowError):
+            return Response({"error": "Invalid sync token."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(sync_changes(since))
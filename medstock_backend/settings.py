@@ -1,5 +1,5 @@
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import os
 from datetime import timedelta
 
@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "inventory.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -101,15 +102,24 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # orjson-backed when orjson is installed, the stock JSON classes otherwise
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'inventory.renderers.FastJSONRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'inventory.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend', 'rest_framework.filters.SearchFilter'],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'inventory.pagination.StandardPagination',
     'PAGE_SIZE': 15,
     'DATE_FORMAT': '%d/%m/%Y',
 }
 
+# Hard cap for the ?page_size= query parameter
+MAX_PAGE_SIZE = config('MAX_PAGE_SIZE', default=100, cast=int)
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=3),
@@ -153,3 +163,71 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Inventory imports: rows written per transaction by the bulk Excel importers
+IMPORT_CHUNK_SIZE = config('IMPORT_CHUNK_SIZE', default=500, cast=int)
+# Excel uploads are imported within the request unless they ask for `?async=1`: they are then
+# queued for `manage.py process_imports` and answered with 202 and an ImportJob. Set True only
+# where that worker runs (the Procfile's `worker`; render.yaml has none) to queue by default,
+# `?async=0` still importing within the request
+IMPORT_ASYNC = config('IMPORT_ASYNC', default=False, cast=bool)
+# A job still running this long after it was claimed is taken to belong to a dead worker
+# and reclaimed by the next worker polling the queue (see inventory.jobs.reclaim_stale_jobs)
+IMPORT_JOB_TIMEOUT_MINUTES = config('IMPORT_JOB_TIMEOUT_MINUTES', default=60, cast=int)
+
+# Exports: rows fetched per database round-trip, and in-memory size before the file spills to disk
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+EXPORT_SPOOL_MAX_SIZE = config('EXPORT_SPOOL_MAX_SIZE', default=5 * 1024 * 1024, cast=int)
+
+# Cache used for dashboard payloads and analytics results. Their keys carry the table versions,
+# which are kept in the database (inventory.cache), so a per-process LocMemCache never serves
+# stale data; a shared backend (file, database or redis) only saves recomputing per worker.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='medstock'),
+    }
+}
+
+DASHBOARD_CACHE_TIMEOUT = config('DASHBOARD_CACHE_TIMEOUT', default=300, cast=int)
+# Most receipts returned by /dashboard/?include=receipts; use /dashboard/receipts/ to page through all
+DASHBOARD_RECEIPTS_LIMIT = config('DASHBOARD_RECEIPTS_LIMIT', default=500, cast=int)
+
+# Analytics results are keyed on table versions, so this only bounds how long stale keys linger
+ANALYTICS_CACHE_TIMEOUT = config('ANALYTICS_CACHE_TIMEOUT', default=3600, cast=int)
+# Horizon, in days, of the near-expiry alerts on the dashboard and /analytics/expiry-risk/
+EXPIRY_ALERT_DAYS = config('EXPIRY_ALERT_DAYS', default=30, cast=int)
+
+# How long Idempotency-Key records are kept before `manage.py purge_idempotency_keys` drops them
+IDEMPOTENCY_KEY_TTL_HOURS = config('IDEMPOTENCY_KEY_TTL_HOURS', default=24, cast=int)
+# Most items accepted by one POST to /receipts/bulk/ or /weekly/reports/bulk/
+BULK_MAX_ITEMS = config('BULK_MAX_ITEMS', default=500, cast=int)
+
+# /sync/ change feed: how long deletions are remembered (older tokens get a full resync), and
+# how far before its token each sync looks, to catch writes committed after the previous sync
+SYNC_TOMBSTONE_DAYS = config('SYNC_TOMBSTONE_DAYS', default=30, cast=int)
+SYNC_OVERLAP_SECONDS = config('SYNC_OVERLAP_SECONDS', default=300, cast=int)
+
+# Response compression (inventory.middleware.CompressionMiddleware): brotli when installed and
+# accepted, gzip otherwise. Smaller bodies and these content types (compressed already; a
+# trailing '/' excludes the whole family) are sent as they are. XLSX is a zip too, but
+# openpyxl's still shrinks by half (`manage.py benchmark compression`), so it is compressed.
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)
+COMPRESSION_EXCLUDED_TYPES = config(
+    'COMPRESSION_EXCLUDED_TYPES',
+    default='application/vnd.apache.parquet,application/zip,application/gzip,application/pdf,image/,audio/,video/',
+    cast=Csv(),
+)
+# 0-11: 4-5 compresses better than gzip at a similar CPU cost; 11 is for static assets
+COMPRESSION_BROTLI_QUALITY = config('COMPRESSION_BROTLI_QUALITY', default=5, cast=int)
+# Brotli has no BREACH padding: responses under these paths, which carry tokens, and any
+# response setting cookies are gzipped (with Django's padding) instead
+COMPRESSION_BROTLI_EXCLUDED_PATHS = config('COMPRESSION_BROTLI_EXCLUDED_PATHS', default='/api/auth/,/admin/', cast=Csv())
+
+# Smallest share of a query's trigrams a name must contain to be returned by
+# /medicines/search/ or suggested in import errors
+SEARCH_MIN_SIMILARITY = config('SEARCH_MIN_SIMILARITY', default=0.5, cast=float)
+
+# Most ids a name filter (?search=, ?medicine_name=) matched in the catalogue sends as an IN
+# list; broader matches are left to the database and its name indexes
+CATALOGUE_SEARCH_MAX_IDS = config('CATALOGUE_SEARCH_MAX_IDS', default=500, cast=int)